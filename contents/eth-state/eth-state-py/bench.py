@@ -0,0 +1,103 @@
+# rough ingest benchmarks for the blockchain engines
+# usage: python bench.py [n_txs] [block_size] [backend]
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+from utils import AVAILABLE_BACKENDS, BACKENDS, DEFAULT_BACKEND, Transaction, open_db
+import v1
+import v2
+
+
+def random_txs(n, n_accounts=1000, seed=0):
+    rng = random.Random(seed)
+    return [Transaction(f"{rng.randrange(n_accounts):x}", rng.randrange(1000)) for _ in range(n)]
+
+
+@contextlib.contextmanager
+def timed(name, n, unit="txs"):
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed:8.3f}s  {n / elapsed:12,.0f} {unit}/s")
+
+
+def bench_ingest(n, block_size, backend=DEFAULT_BACKEND):
+    txs = random_txs(n)
+    blocks = [txs[i : i + block_size] for i in range(0, n, block_size)]
+
+    for name, module in [("v1", v1), ("v2", v2)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            chain = module.Blockchain(backend=backend, path=os.path.join(tmp, "txs"))
+            with timed(f"{name} process_tx", n):
+                for tx in txs:
+                    chain.process_tx(tx)
+
+            batched = module.Blockchain(backend=backend, path=os.path.join(tmp, "blocks"))
+            with timed(f"{name} process_block ({block_size})", n):
+                for block in blocks:
+                    batched.process_block(block)
+
+            # same final state either way
+            for tx in txs[-100:]:
+                assert chain.get_account(tx.address) == batched.get_account(tx.address)
+
+
+# blocks off the head's fork + switching back and forth between the forks of an n account state
+# (neither should cost O(accounts): only the blocks' changes are re-hashed)
+def bench_forks(n, block_size, backend=DEFAULT_BACKEND, n_blocks=20):
+    rng = random.Random(0)
+    blocks = [[Transaction(f"{rng.randrange(n):x}", rng.randrange(1000)) for _ in range(block_size)] for _ in range(n_blocks)]
+
+    for name, module in [("v1", v1), ("v2", v2)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            chain = module.Blockchain(backend=backend, path=tmp)
+            for lo in range(0, n, 10_000):
+                chain.process_block([Transaction(f"{i:x}", i) for i in range(lo, min(lo + 10_000, n))])
+            base = chain.head
+            main = chain.process_block(blocks[0])
+
+            with timed(f"{name} side fork block", n_blocks, "blocks"):
+                for txs in blocks:
+                    chain.process_block(txs, parent=base)
+            assert chain.head is main
+
+            fork = chain.process_block(blocks[1], parent=base)
+            with timed(f"{name} set_head + block", n_blocks, "blocks"):
+                for i, txs in enumerate(blocks):
+                    chain.set_head(fork if i % 2 else main)
+                    chain.process_block(txs)
+
+
+def bench_backends(n):
+    rng = random.Random(0)
+    items = [(rng.randbytes(32), rng.randbytes(100)) for _ in range(n)]
+    keys = [k for k, _ in items]
+    rng.shuffle(keys)
+
+    for backend in BACKENDS:
+        if backend not in AVAILABLE_BACKENDS:
+            print(f"{backend} skipped (not installed)")
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            db = open_db(backend, os.path.join(tmp, "bench.db"))
+            with timed(f"{backend} put_many", n, "keys"):
+                for i in range(0, n, 1000):
+                    db.put_many(items[i : i + 1000])
+            with timed(f"{backend} get", n, "keys"):
+                for k in keys:
+                    db.get(k)
+            with timed(f"{backend} iter_range", n, "keys"):
+                assert sum(1 for _ in db.iter_range()) == n
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    backend = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_BACKEND
+    bench_ingest(n, block_size, backend)
+    bench_forks(n, block_size, backend)
+    bench_backends(n)
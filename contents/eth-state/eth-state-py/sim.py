@@ -0,0 +1,373 @@
+# randomized simulation of the blockchain engines: seeded random blocks of
+# txs drive v1 + v2 in lock-step and the invariants are checked as it goes
+#   - both engines agree on the touched accounts (every block) + every account (every `check_every` blocks)
+#   - a shard re-run from its seed gives the same roots (the first `rerun_blocks` blocks, None = all)
+#   - state roots are deterministic: both match a root re-built from a plain dict model
+#   - historical reads are stable: sampled (block, address, amount) reads still return the same amount
+#   - with `keep`: the reads of the blocks the last collection pruned raise KeyError (the kept ones dont change)
+# a `forks` share of the blocks go on a side fork (a parent a few blocks below
+# the head) + a head switch (to a recent block of any fork) is drawn before
+# about forks / 4 of the blocks, both seeded so a shard's run is reproducible
+# the model keeps each block's changes + parent: reads on any fork are checked
+# against it (the head's amounts are kept in full, re-built along the path on a reorg)
+# each seed is a shard (run in a process pool) which logs its txs + roots to
+# events-<seed>.csv so a run can be replayed (eg, against a changed engine)
+#   events: height, event ("tx"/"block"/"head"), address, amount, block, v1 root, v2 root
+#   block: the parent's id on a block (empty = the head) / the new head's id on a head switch
+#   (block ids count the blocks in the order they were added, the genesis is 0)
+# usage: python sim.py [n_seeds] [n_txs] [block_size] [backend] [check_every] [rerun_blocks] [n_accounts] [keep] [forks]
+#        ("-" = the default, eg, rerun_blocks/keep = None)
+#        python sim.py replay <events.csv> [backend]
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from utils import EMPTY_ROOT, Account, DictDB, MerkleTree, PersistentMap, Transaction, hash
+import v1
+import v2
+
+FORK_DEPTH = 3  # side forks + head switches stay within this many blocks of the head
+
+
+def random_blocks(seed, n_txs, block_size, n_accounts=1000):
+    rng = random.Random(seed)
+    for lo in range(0, n_txs, block_size):
+        n = min(block_size, n_txs - lo)
+        yield [Transaction(f"{rng.randrange(n_accounts):x}", rng.randrange(1000)) for _ in range(n)]
+
+
+class Sim:
+    def __init__(self, seed=0, backend="dict", check_every=1, keep=None, forks=0.0) -> None:
+        # both engines' dbs live in a temp directory (removed by close())
+        self.tmp = tempfile.TemporaryDirectory()
+        self.v1 = v1.Blockchain(backend=backend, keep=keep, path=os.path.join(self.tmp.name, "v1"))
+        self.v2 = v2.Blockchain(backend=backend, keep=keep, path=os.path.join(self.tmp.name, "v2"))
+        self.rng = random.Random(seed)  # samples the checks (not the txs)
+        self.fork_rng = random.Random(f"forks {seed}")  # draws the side forks + head switches
+        self.check_every = check_every
+        self.keep = keep
+        self.forks = forks
+
+        # model: block id => (v1 block, v2 block), parent id, height, address => amount it set
+        self.blocks = [(self.v1.head, self.v2.head)]
+        self.parents = [None]
+        self.heights = [0]
+        self.changes = [{}]
+        self.by_height = [[0]]  # height => block ids
+        self.head = 0
+        self.live = {0}  # ids of the blocks the collections kept
+        # the head's address => amount (in v2's slot order: first insertion on the head's fork)
+        self.amounts = {}
+        self.reads = []  # sampled (block id, address, amount)
+        self.n_blocks = 0
+        self.n_txs = 0
+        self.n_side = 0  # blocks on a side fork
+        self.n_switches = 0  # head switches (drawn + side forks which became the longest)
+
+    # the parent of the next block: a block a few below the head (None = the head)
+    def pick_parent(self):
+        if self.fork_rng.random() >= self.forks:
+            return None
+        parents, block = [], self.parents[self.head]
+        while block is not None and len(parents) < FORK_DEPTH:
+            if block in self.live:
+                parents.append(block)
+            block = self.parents[block]
+        return self.fork_rng.choice(parents) if parents else None
+
+    # a new head: a recent block of any fork (None = no switch)
+    def pick_head(self):
+        if self.fork_rng.random() >= self.forks / 4:
+            return None
+        height = self.heights[self.head]
+        heads = [
+            block
+            for h in range(max(height - FORK_DEPTH, 0), min(height + FORK_DEPTH + 1, len(self.by_height)))
+            for block in self.by_height[h]
+            if block in self.live and block != self.head
+        ]
+        return self.fork_rng.choice(heads) if heads else None
+
+    # switches both engines' heads to a block
+    def set_head(self, block):
+        b1, b2 = self.blocks[block]
+        self.v1.set_head(b1)
+        self.v2.set_head(b2)
+        self._move_head(block)
+        self.n_switches += 1
+        self.check_all()
+
+    # processes one block on both engines + checks the invariants, returns the roots
+    # parent: a block id (default: the head)
+    def step(self, txs: list[Transaction], parent=None):
+        parent = self.head if parent is None else parent
+        p1, p2 = self.blocks[parent]
+        b1 = self.v1.process_block(txs, p1)
+        b2 = self.v2.process_block(txs, p2)
+        self.n_blocks += 1
+        self.n_txs += len(txs)
+
+        # the new block: the head if it extends the head or its fork is now the longest
+        block, height = len(self.blocks), self.heights[parent] + 1
+        self.blocks.append((b1, b2))
+        self.parents.append(parent)
+        self.heights.append(height)
+        self.changes.append({tx.address: tx.amount for tx in txs})
+        if height == len(self.by_height):
+            self.by_height.append([])
+        self.by_height[height].append(block)
+        self.live.add(block)
+        if parent == self.head:
+            self.amounts.update(self.changes[block])
+            self.head = block
+        else:
+            self.n_side += 1
+            if height > self.heights[self.head]:
+                self._move_head(block)
+                self.n_switches += 1
+        assert self.v1.head == self.blocks[self.head][0] and self.v2.head == self.blocks[self.head][1]
+
+        # the engines collect once every `keep` blocks: wait for it so the pruned blocks are known
+        if self.keep is not None:
+            self.v1.pruner.wait()
+            for pruner in self.v2.pruners:
+                pruner.wait()
+            if height % self.keep == 0:
+                top = self.heights[self.head]
+                self.live = {block for block in self.live if top - self.keep < self.heights[block] <= top}
+
+        for address, amount in self.changes[block].items():
+            if block in self.live:  # (a side block below a small `keep` window is pruned right away)
+                assert self.read(address, block) == amount, f"{address} @ block {block}: != {amount}"
+        for address in self.rng.sample(list(self.amounts), min(4, len(self.amounts))):
+            self.reads.append((self.head, address, self.amounts[address]))
+
+        if self.n_blocks % self.check_every == 0:
+            self.check_all()
+        return b1.state_root, b2.state_root
+
+    # the head's model amounts => the block's: undoes the changes of the head's
+    # fork back to the common ancestor + redoes the block's fork's
+    def _move_head(self, block):
+        undo, redo = [], []
+        a, b = self.head, block
+        while a != b:
+            if self.heights[a] >= self.heights[b]:
+                undo.append(a)
+                a = self.parents[a]
+            else:
+                redo.append(b)
+                b = self.parents[b]
+        for address in {address for undone in undo for address in self.changes[undone]}:
+            amount = self.amount_at(address, a)
+            if amount is None:
+                del self.amounts[address]  # first set on the undone fork
+            else:
+                self.amounts[address] = amount
+        for redone in reversed(redo):
+            self.amounts.update(self.changes[redone])
+        self.head = block
+
+    # the model's amount of an address at a block (None = not set on its fork)
+    def amount_at(self, address, block):
+        while block is not None:
+            if address in self.changes[block]:
+                return self.changes[block][address]
+            block = self.parents[block]
+        return None
+
+    # both engines' amount at the head (or at a block id: read at its height
+    # on its fork) + checks they agree, KeyError if both pruned the block
+    def read(self, address, block=None):
+        if block is None:
+            a1, a2 = self.v1.get_account(address), self.v2.get_account(address)
+        else:
+            b1, b2 = self.blocks[block]
+            height = self.heights[block]
+            a1 = _or_pruned(self.v1.get_account_at, address, height, b1)
+            a2 = _or_pruned(self.v2.get_account_at, address, height, b2)
+            if a1 is KeyError or a2 is KeyError:
+                assert a1 is a2, f"one engine pruned block {block}: v1={a1} v2={a2}"
+                raise KeyError(f"block {block} was pruned")
+        a2 = None if a2 is None else a2.amount
+        assert a1 == a2, f"engines disagree on {address} @ {block}: v1={a1} v2={a2}"
+        return a1
+
+    def check_account(self, address):
+        amount = self.read(address)
+        assert amount == self.amounts[address], f"{address}: {amount} != {self.amounts[address]}"
+
+    def check_all(self):
+        for address in self.amounts:
+            self.check_account(address)
+
+        # roots re-built from the model
+        # v1: a map of the amounts built in one update, v2: positional tree of the account hashes
+        amounts = {address: v1.encode_amount(amount) for address, amount in self.amounts.items()}
+        map_root = PersistentMap(DictDB()).update(EMPTY_ROOT, amounts)
+        slot_tree = MerkleTree(sort=False)
+        for address, amount in self.amounts.items():
+            slot_tree.insert(Account(address, amount).hash())
+        assert self.v1.head.state_root == map_root, f"v1 root mismatch at block {self.head}"
+        assert self.v2.head.state_root == slot_tree.root, f"v2 root mismatch at block {self.head}"
+
+        # historical reads (the pruned blocks' raise KeyError)
+        for block, address, amount in self.rng.sample(self.reads, min(100, len(self.reads))):
+            if block in self.live:
+                assert self.read(address, block) == amount, f"{address} @ block {block} changed"
+            else:
+                try:
+                    self.read(address, block)
+                    assert False, f"block {block} wasnt pruned"
+                except KeyError:
+                    pass
+
+    def close(self):
+        self.tmp.cleanup()
+
+
+# the engine's read or KeyError (the class) if the block was pruned
+def _or_pruned(get_account_at, address, height, head):
+    try:
+        return get_account_at(address, height, head)
+    except KeyError:
+        return KeyError
+
+
+# the seed's blocks on the sim: yields (new head or None, parent or None, txs, roots) per block
+def drive(sim, blocks):
+    for txs in blocks:
+        head = sim.pick_head()
+        if head is not None:
+            sim.set_head(head)
+        parent = sim.pick_parent()
+        yield head, parent, txs, sim.step(txs, parent)
+
+
+# (runs in a worker) one seed => stats, raises AssertionError if an invariant breaks
+def run_shard(
+    seed, n_txs, block_size, backend="dict", log_dir=None, check_every=1, rerun_blocks=None,
+    n_accounts=1000, keep=None, forks=0.1,
+):
+    sim = Sim(seed, backend, check_every, keep, forks)
+    blocks = random_blocks(seed, n_txs, block_size, n_accounts)
+    roots = []  # (v1, v2) per block
+    log = None
+    if log_dir is not None:
+        log = open(os.path.join(log_dir, f"events-{seed}.csv"), "w", newline="")
+        writer = csv.writer(log)
+        writer.writerow(["height", "event", "address", "amount", "block", "v1_root", "v2_root"])
+
+    start = time.perf_counter()
+    for head, parent, txs, (root1, root2) in drive(sim, blocks):
+        roots.append((root1, root2))
+        if log is not None:
+            if head is not None:
+                writer.writerow(["", "head", "", "", head, "", ""])
+            height = sim.heights[-1]
+            writer.writerows([height, "tx", tx.address, tx.amount, "", "", ""] for tx in txs)
+            writer.writerow([height, "block", "", "", "" if parent is None else parent, root1.hex(), root2.hex()])
+    elapsed = time.perf_counter() - start
+    if log is not None:
+        log.close()
+    sim.close()
+
+    # same seed => same roots (+ the same forks)
+    rerun = Sim(seed, backend, check_every, keep, forks)
+    blocks = random_blocks(seed, n_txs, block_size, n_accounts)
+    for (_, _, _, got), expected in zip(drive(rerun, blocks), roots[:rerun_blocks]):
+        assert got == expected, f"seed {seed}: non-deterministic roots"
+    rerun.close()
+
+    return {
+        "seed": seed,
+        "blocks": sim.n_blocks,
+        "side": sim.n_side,
+        "switches": sim.n_switches,
+        "txs": sim.n_txs,
+        "elapsed": elapsed,
+        "roots": hash([r1 + r2 for r1, r2 in roots]).hex(),
+    }
+
+
+# re-drives the engines with a logged run + checks the logged roots
+def replay(path, backend="dict", check_every=1):
+    sim = Sim(backend=backend, check_every=check_every)
+    txs = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["event"] == "tx":
+                txs.append(Transaction(row["address"], int(row["amount"])))
+                continue
+            if row["event"] == "head":
+                sim.set_head(int(row["block"]))
+                continue
+            parent = int(row["block"]) if row["block"] else None
+            root1, root2 = sim.step(txs, parent)
+            assert root1.hex() == row["v1_root"], f"v1 root changed at {row['height']}"
+            assert root2.hex() == row["v2_root"], f"v2 root changed at {row['height']}"
+            txs = []
+    sim.close()
+    return sim.n_blocks
+
+
+def run(
+    seeds, n_txs, block_size, backend="dict", log_dir=None, workers=None, check_every=1, rerun_blocks=None,
+    n_accounts=1000, keep=None, forks=0.1,
+):
+    ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        shards = [
+            pool.submit(
+                run_shard, seed, n_txs, block_size, backend, log_dir, check_every, rerun_blocks,
+                n_accounts, keep, forks,
+            )
+            for seed in seeds
+        ]
+        stats = [shard.result() for shard in shards]
+    for s in stats:
+        print(
+            f"seed {s['seed']:<4} {s['blocks']:8} blocks ({s['side']} side, {s['switches']} head switches)"
+            f"  {s['txs'] / s['elapsed']:10,.0f} txs/s  roots {s['roots'][:16]}"
+        )
+    return stats
+
+
+# the i-th command line arg ("-" or missing = the default)
+def arg(i, default, parse=int):
+    return parse(sys.argv[i]) if len(sys.argv) > i and sys.argv[i] != "-" else default
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        backend = arg(3, "dict", str)
+        print("replayed", replay(sys.argv[2], backend), "blocks")
+        sys.exit(0)
+
+    n_seeds = arg(1, 4)
+    n_txs = arg(2, 20000)
+    block_size = arg(3, 100)
+    backend = arg(4, "dict", str)
+    check_every = arg(5, 1)
+    rerun_blocks = arg(6, None)
+    n_accounts = arg(7, 1000)
+    keep = arg(8, None)
+    forks = arg(9, 0.1, float)
+
+    log_dir = os.path.abspath("sim-logs")
+    os.makedirs(log_dir, exist_ok=True)
+    start = time.perf_counter()
+    stats = run(
+        range(n_seeds), n_txs, block_size, backend, log_dir, check_every=check_every, rerun_blocks=rerun_blocks,
+        n_accounts=n_accounts, keep=keep, forks=forks,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"{sum(s['txs'] for s in stats):,} txs over {n_seeds} seeds in {elapsed:.1f}s")
+
+    # a logged run replays to the same roots
+    assert replay(os.path.join(log_dir, "events-0.csv"), backend, check_every) == stats[0]["blocks"]
@@ -1,42 +1,79 @@
-import hashlib
-
+import bisect
+import os
+import sys
 
-def hexhash(x):
-    if type(x) != list:
-        x = [x]
-    m = hashlib.sha256()
-    for _x in x:
-        m.update(_x)
-    y = m.hexdigest()
-    return y
+# the hash selection, the binary codec + the cache are shared with the tree code in ../more_trees
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "more_trees"))
+import hashing
+from hashing import HASHES, DIGEST_SIZE, hash, hash_many, hexhash, set_hash
+from codec import write_varint, read_varint, write_bytes, read_bytes, write_str, read_str
+from cache import LRUCache
 
 
-def hash(x):
-    if type(x) != list:
-        x = [x]
-    m = hashlib.sha256()
-    for _x in x:
-        m.update(_x)
-    y = m.digest()
-    return y
+HASH_SIZE = DIGEST_SIZE
 
 
 class MerkleTree:
-    def __init__(self) -> None:
-        self.leafs = []
+    def __init__(self, sort=True) -> None:
+        # sort=True: leaf hashes are kept sorted (same root for any insertion order)
+        # sort=False: leaf hashes are kept in insertion order + can be updated by position
+        self.sort = sort
+        self.leafs = []  # leaf hashes
         self.merkle_tree = []
+        # lowest leaf index whose position shifted/was added since the last commit
+        # (None = none) + leaf indices which were updated in place
+        self.dirty_from = None
+        self.changed = set()
 
     @property
     def root(self):
-        self.commit()
+        self.commit()  # no-op if nothing changed
         if len(self.merkle_tree) == 0:
             return bytes(0)
         root = self.merkle_tree[-1]
         assert len(root) == 1
         return bytes(root[0])
 
+    # note: an unordered merkle tree means different insertions = different state root
+    # sorted trees order the hashes to get a sorted/consistent merkle tree: each
+    # leaf hash is inserted in its sorted position
+    # cost: the search is O(log n) but an insert/remove in the middle is O(n):
+    # the list shifts + the next commit re-hashes every pair to its right
+    # (~n/2 hashes for a random hash), only appends + updates are O(log n)
+    # (v1 keys its state by a hash trie instead, see PersistentMap)
     def insert(self, x):
-        self.leafs.append(x)
+        h = hash(x)
+        if self.sort:
+            i = bisect.bisect_left(self.leafs, h)
+            self.leafs.insert(i, h)
+        else:
+            i = len(self.leafs)
+            self.leafs.append(h)
+        self._shifted(i)
+
+    def remove(self, x):
+        assert self.sort
+        h = hash(x)
+        i = bisect.bisect_left(self.leafs, h)
+        assert i < len(self.leafs) and self.leafs[i] == h
+        del self.leafs[i]
+        self._shifted(i)
+
+    # replace the leaf at position i (unsorted trees)
+    def update(self, i, x):
+        assert not self.sort
+        self.leafs[i] = hash(x)
+        self.changed.add(i)
+
+    # drop the leafs at/after position n (unsorted trees)
+    def truncate(self, n):
+        assert not self.sort
+        del self.leafs[n:]
+        self._shifted(n)
+
+    def _shifted(self, i):
+        if self.dirty_from is None or i < self.dirty_from:
+            self.dirty_from = i
 
     def commit(self):
         # builds the merkle tree
@@ -48,71 +85,739 @@ class MerkleTree:
         # self.mt[0][2, 3] =parent=> self.mt[1][1]
 
         # self.mt[j-1][(2i), (2i + 1)] =parent=> self.mt[j][i]
-        if len(self.leafs) == 0:
+        if self.dirty_from is None and len(self.changed) == 0:
             return
 
-        self.merkle_tree = []  # clear
-        y = [hash(x) for x in self.leafs]
-
-        # note: this is an unordered merkle tree so different insertions = different state root
-        # we can order the hashes though and get a sorted/consistent merkle tree
-        # note: this is O(nlogn) but can probs get O(logn) if we do it on insertion
-        y.sort()
+        if len(self.leafs) == 0:
+            self.merkle_tree = []
+            self.dirty_from = None
+            return
 
-        self.merkle_tree.append(y)
+        # only the parent chains of changed leafs are re-hashed + every parent
+        # at/after the first shifted leaf: an append/update re-hashes one parent
+        # chain (O(log n)), a sorted insert in the middle shifts the pairs to
+        # its right so those are re-hashed too (O(n))
+        lo = len(self.leafs) if self.dirty_from is None else self.dirty_from
+        changed = self.changed
+        y = self.leafs
+        levels = [y]
         while len(y) > 1:
-            parents = []
-            for i in range(0, len(y), 2):
-                if (i + 1) == len(y):
-                    children = y[i]
-                else:
-                    children = [y[i], y[i + 1]]
-                print(children)
-                parent = hash(children)
-                parents.append(parent)
+            lo //= 2  # first parent which shifted
+            changed = {i // 2 for i in changed if i // 2 < lo}
+            j = len(levels)
+            parents = self.merkle_tree[j] if j < len(self.merkle_tree) else []
+            del parents[lo:]
+
+            # one batch of hashes per level
+            updated = sorted(changed)
+            children = [y[2 * i] + y[2 * i + 1] for i in updated]
+            children += [y[i] + y[i + 1] for i in range(2 * lo, len(y) - 1, 2)]
+            if len(y) % 2 == 1:
+                children.append(y[-1])
+            hashes = hash_many(children)
+            for i, h in zip(updated, hashes):
+                parents[i] = h
+            parents += hashes[len(updated) :]
+
             y = parents
-            self.merkle_tree.append(y)
+            levels.append(y)
 
+        self.merkle_tree = levels
+        self.dirty_from = None
+        self.changed = set()
 
-import leveldb
-import os
-import shutil
+    # range proof for the leafs [lo, hi): per level, the sibling hashes left +
+    # right of the range (the hashes inside the range are recomputed by the verifier)
+    def prove_range(self, lo, hi):
+        self.commit()
+        proof = []
+        for level in self.merkle_tree[:-1]:
+            if lo % 2 == 1:
+                proof.append(level[lo - 1])
+            if hi % 2 == 1 and hi < len(level):
+                proof.append(level[hi])
+            lo, hi = lo // 2, (hi + 1) // 2
+        return proof
+
+
+# checks the leaf hashes at [lo, lo + len(leafs)) of a tree with n leafs against its root
+def verify_range(root, n, lo, leafs, proof) -> bool:
+    proof = iter(proof)
+    level = list(leafs)
+    try:
+        while n > 1:
+            if lo % 2 == 1:
+                level.insert(0, next(proof))
+                lo -= 1
+            hi = lo + len(level)
+            if hi % 2 == 1 and hi < n:
+                level.append(next(proof))
+            pairs = [level[i : i + 2] for i in range(0, len(level), 2)]
+            level = hash_many([b"".join(pair) for pair in pairs])
+            lo, n = lo // 2, (n + 1) // 2
+    except StopIteration:
+        return False  # proof is too short
+    return next(proof, None) is None and level == [root]
+
+
+# persistent (copy-on-write) map of key => value stored in a db
+# its a 16-ary hash trie over the nibbles of hash(key): nodes are stored
+# under the hash of their encoding, so an update only writes the new nodes
+# on the changed paths (O(log16 n) per key) and every other node is shared
+# with the previous version. a version of the map is just its root id
+#   leaf: 0x01 + key + value
+#   branch: 0x00 + 16-bit children bitmap + child ids
+EMPTY_ROOT = bytes(0)
+
+
+class PersistentMap:
+    def __init__(self, db, prefix=b"n"):
+        self.db = db
+        self.prefix = prefix  # db key prefix of the nodes
+
+    def _load(self, node_id):
+        buf = memoryview(self.db.get(self.prefix + node_id))
+        if buf[0] == 1:
+            key, offset = read_str(buf, 1)
+            value, _ = read_bytes(buf, offset)
+            return (key, bytes(value))
+
+        bitmap = int.from_bytes(buf[1:3], "little")
+        children = [None] * 16
+        offset = 3
+        for i in range(16):
+            if bitmap >> i & 1:
+                children[i] = bytes(buf[offset : offset + HASH_SIZE])
+                offset += HASH_SIZE
+        return children
+
+    def _put(self, data):
+        node_id = hash(data)
+        self.db.put(self.prefix + node_id, data)
+        return node_id
+
+    def _put_leaf(self, key, value):
+        out = bytearray(b"\x01")
+        write_str(out, key)
+        write_bytes(out, value)
+        return self._put(bytes(out))
+
+    def _put_branch(self, children):
+        out = bytearray(b"\x00")
+        bitmap = sum(1 << i for i, child in enumerate(children) if child is not None)
+        out += bitmap.to_bytes(2, "little")
+        for child in children:
+            if child is not None:
+                out += child
+        return self._put(bytes(out))
 
+    @staticmethod
+    def _path(key):
+        return hash(key.encode("utf-8"))
 
-class DB:
-    def __init__(self, dbfile, resume=True):
-        if not resume and os.path.exists(dbfile):
-            # delete the db directory
-            shutil.rmtree(dbfile)
+    @staticmethod
+    def _nibble(path, depth):
+        b = path[depth // 2]
+        return b >> 4 if depth % 2 == 0 else b & 0x0F
+
+    def get(self, root, key):
+        path = self._path(key)
+        node_id, depth = root, 0
+        while node_id != EMPTY_ROOT and node_id is not None:
+            node = self._load(node_id)
+            if type(node) is tuple:
+                return node[1] if node[0] == key else None
+            node_id = node[self._nibble(path, depth)]
+            depth += 1
+        return None
+
+    # items: {key: value} => root of the new version
+    def update(self, root, items):
+        items = [(self._path(key), key, value) for key, value in items.items()]
+        if len(items) == 0:
+            return root
+        return self._update(root, 0, items)
+
+    def _update(self, node_id, depth, items):
+        if node_id == EMPTY_ROOT or node_id is None:
+            return self._build(depth, items)
+
+        node = self._load(node_id)
+        if type(node) is tuple:
+            # leaf => push the old leaf down with the new items (unless its overwritten)
+            key, value = node
+            if all(key != k for _, k, _ in items):
+                items = items + [(self._path(key), key, value)]
+            return self._build(depth, items)
+
+        children = list(node)
+        for i, group in self._group(depth, items).items():
+            children[i] = self._update(children[i], depth + 1, group)
+        return self._put_branch(children)
+
+    # builds a new subtree from items
+    def _build(self, depth, items):
+        if len(items) == 1:
+            _, key, value = items[0]
+            return self._put_leaf(key, value)
+
+        children = [None] * 16
+        for i, group in self._group(depth, items).items():
+            children[i] = self._build(depth + 1, group)
+        return self._put_branch(children)
+
+    def _group(self, depth, items):
+        groups = {}
+        for item in items:
+            groups.setdefault(self._nibble(item[0], depth), []).append(item)
+        return groups
+
+    # db keys of every node reachable from the roots (see Pruner)
+    def reachable(self, roots, live=None):
+        live = set() if live is None else live
+        stack = [root for root in roots if root != EMPTY_ROOT]
+        while stack:
+            node_id = stack.pop()
+            key = self.prefix + node_id
+            if key in live:
+                continue  # shared subtree
+            live.add(key)
+            node = self._load(node_id)
+            if type(node) is list:
+                stack.extend(child for child in node if child is not None)
+        return live
+
+    # all (key, value) pairs of a version
+    def items(self, root):
+        stack = [root] if root != EMPTY_ROOT else []
+        while stack:
+            node = self._load(stack.pop())
+            if type(node) is tuple:
+                yield node
+            else:
+                stack.extend(child for child in node if child is not None)
+
+
+import contextlib
+import mmap
+import os
+import shutil
+import sqlite3
+import threading
+
+# leveldb is optional: without it the "leveldb" backend cant be opened
+# (DEFAULT_BACKEND is then the in-memory "dict", for tests/dev)
+try:
+    import leveldb
+except ImportError:
+    leveldb = None
+
+
+# key-value store interface shared by all the storage backends
+# backends implement:
+#   _get(key) -> value or None
+#   _write([(key, value)]) -> writes all the items atomically (value=None is a delete)
+#   _iter(start, end, include_value) -> lazily yields the (key, value)s with start <= key < end
+#     in key order (value=None if not include_value: the values arent read)
+# and get batched/buffered writes, iterators + dict-style access (db[key]) on top
+class KV:
+    available = True  # False if the backend's module isnt installed
 
-        self.db = leveldb.LevelDB(dbfile)
+    def __init__(self) -> None:
+        self.buffer = None  # key => value (None = delete) while buffering writes (see `buffered`)
+        self.barrier = None  # keys written while a collection is running (see Pruner)
+        self.lock = threading.Lock()  # serializes writes with a Pruner's sweeps
 
+    # value or None if the key doesnt exist (other errors are raised)
     def get(self, key):
-        try:
-            return self.db.Get(key)
-        except:
-            return ""
+        if self.buffer is not None and key in self.buffer:
+            return self.buffer[key]
+        return self._get(key)
+
+    def get_many(self, keys):
+        get = self.get
+        return [get(key) for key in keys]
 
     def put(self, key, value):
-        return self.db.Put(key, value)
+        if self.buffer is not None:
+            self.buffer[key] = value
+        else:
+            self._commit([(key, value)])
+
+    # all the items are written atomically (one batch)
+    def put_many(self, items):
+        if self.buffer is not None:
+            self.buffer.update(items)
+        else:
+            self._commit(list(items))
 
     def delete(self, key):
-        return self.db.Delete(key)
+        if self.buffer is not None:
+            self.buffer[key] = None
+        else:
+            self._commit([(key, None)])
+
+    # collects the writes in the block (eg, all of a block's nodes) + flushes
+    # them once as one atomic batch (nothing is written on an exception)
+    # NOTE: the iterators below dont see buffered writes
+    @contextlib.contextmanager
+    def buffered(self):
+        if self.buffer is not None:  # already buffering (nested)
+            yield self
+            return
+        self.buffer = {}
+        try:
+            yield self
+            self.flush()
+        finally:
+            self.buffer = None
+
+    def flush(self):
+        if self.buffer:
+            self._commit(list(self.buffer.items()))
+            self.buffer.clear()
+
+    # every write goes through here
+    def _commit(self, items):
+        with self.lock:
+            if self.barrier is not None:
+                self.barrier.update(bytes(key) for key, _ in items)
+            self._write(items)
+
+    # lazily yields the (key, value)s (or keys) in [start, end) in key order
+    def iter_range(self, start=None, end=None, include_value=True):
+        for key, value in self._iter(start, end, include_value):
+            yield (key, value) if include_value else key
+
+    # lazily yields the (key, value)s (or keys) whose key starts with prefix
+    def iter_prefix(self, prefix, include_value=True):
+        for key, value in self._iter(prefix, None, include_value):
+            if not key.startswith(prefix):
+                return
+            yield (key, value) if include_value else key
+
+    # dict-style access (eg, as the db of the more_trees merkle trees)
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return self.iter_range(include_value=False)
+
+    def update(self, items):
+        self.put_many(items.items() if hasattr(items, "items") else items)
+
+
+# sorted view of a dict's keys (rebuilt on the next iteration after a new key/delete)
+def _iter_sorted(db, data, start, end, include_value):
+    if db.keys is None:
+        db.keys = sorted(data)
+    keys = db.keys
+    lo = 0 if start is None else bisect.bisect_left(keys, start)
+    hi = len(keys) if end is None else bisect.bisect_left(keys, end)
+    for i in range(lo, hi):
+        key = keys[i]
+        if key in data:  # skips keys deleted while iterating
+            yield key, db._get(key) if include_value else None
+
+
+class DictDB(KV):
+    def __init__(self, path=None, resume=True) -> None:
+        super().__init__()
+        self.data = {}
+        self.keys = None
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _write(self, items):
+        data = self.data
+        for key, value in items:
+            key = bytes(key)
+            if value is None:
+                data.pop(key, None)
+                self.keys = None
+            else:
+                if key not in data:
+                    self.keys = None
+                data[key] = bytes(value)
+
+    def _iter(self, start, end, include_value=True):
+        return _iter_sorted(self, self.data, start, end, include_value)
+
+
+class LevelDB(KV):
+    available = leveldb is not None
+
+    def __init__(self, path, resume=True):
+        super().__init__()
+        if not resume and os.path.exists(path):
+            # delete the db directory
+            shutil.rmtree(path)
+
+        self.db = leveldb.LevelDB(path)
+
+    def _get(self, key):
+        try:
+            return self.db.Get(key)
+        except KeyError:
+            return None
+
+    def _write(self, items):
+        batch = leveldb.WriteBatch()
+        for key, value in items:
+            if value is None:
+                batch.Delete(key)
+            else:
+                batch.Put(key, value)
+        self.db.Write(batch, sync=False)
+
+    def _iter(self, start, end, include_value=True):
+        # RangeIter's key_to is inclusive (+ it yields bare keys without the values)
+        for item in self.db.RangeIter(key_from=start, key_to=end, include_value=include_value):
+            key, value = item if include_value else (item, None)
+            key = bytes(key)
+            if end is not None and key >= end:
+                return
+            yield key, value
+
+
+class SqliteDB(KV):
+    def __init__(self, path, resume=True):
+        super().__init__()
+        if not resume and os.path.exists(path):
+            os.remove(path)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key BLOB PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+        )
+
+    def _get(self, key):
+        row = self.conn.execute("SELECT value FROM kv WHERE key = ?", (bytes(key),)).fetchone()
+        return None if row is None else row[0]
+
+    def _write(self, items):
+        ops = {bytes(key): value for key, value in items}  # the last write per key wins
+        puts = [(key, bytes(value)) for key, value in ops.items() if value is not None]
+        deletes = [(key,) for key, value in ops.items() if value is None]
+        with self.conn:  # one transaction
+            self.conn.executemany("INSERT OR REPLACE INTO kv VALUES (?, ?)", puts)
+            self.conn.executemany("DELETE FROM kv WHERE key = ?", deletes)
+
+    def _iter(self, start, end, include_value=True):
+        columns = "key, value" if include_value else "key, NULL"
+        query, args = f"SELECT {columns} FROM kv WHERE key >= ?", [bytes(start or b"")]
+        if end is not None:
+            query += " AND key < ?"
+            args.append(bytes(end))
+        yield from self.conn.execute(query + " ORDER BY key", args)
+
+
+# append-only log of write batches read through a memory map + an in-memory
+# key => (value offset, value length) index (rebuilt by replaying the log on open)
+# a read is one index lookup + one slice of the map: no seeks/syscalls (archive nodes)
+#   batch: varint n_bytes + records (a batch with a truncated tail is ignored => atomic)
+#   record: 1 byte op (1 = put, 0 = delete) + length-prefixed key (+ length-prefixed value)
+class LogDB(KV):
+    def __init__(self, path, resume=True):
+        super().__init__()
+        if not resume and os.path.exists(path):
+            os.remove(path)
+
+        self.file = open(path, "ab+")
+        self.index = {}
+        self.keys = None
+        self.mm = None
+        self.mapped = 0  # n bytes currently mapped
+        self.end = 0  # end of the last complete batch
+        self._remap()
+        self._replay()
+
+    # the old map isnt closed: a reader in another thread (eg, a Pruner) may
+    # still be slicing it, its unmapped once its no longer referenced
+    def _remap(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if size > self.mapped:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mapped = size
+        return self.mm
+
+    def _replay(self):
+        if self.mm is None:
+            return
+        with memoryview(self.mm) as buf:
+            offset = 0
+            while offset < self.mapped:
+                try:
+                    n, start = read_varint(buf, offset)
+                except IndexError:
+                    break
+                end = start + n
+                if end > self.mapped:
+                    break  # truncated batch
+                while start < end:
+                    op = buf[start]
+                    key, start = read_bytes(buf, start + 1)
+                    key = bytes(key)
+                    if op == 1:
+                        n, start = read_varint(buf, start)
+                        self.index[key] = (start, n)
+                        start += n
+                    else:
+                        self.index.pop(key, None)
+                offset = end
+        self.end = offset
+        if self.end < self.mapped:
+            # drop the truncated batch so new batches append after the last complete one
+            self.file.truncate(self.end)
+            self.mm.close()
+            self.mm, self.mapped = None, 0
+            self._remap()
+
+    def _get(self, key):
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, n = entry
+        mm = self.mm
+        if mm is None or offset + n > len(mm):
+            mm = self._remap()
+        return mm[offset : offset + n]
+
+    def _write(self, items):
+        records = bytearray()
+        updates = []
+        for key, value in items:
+            key = bytes(key)
+            if value is None:
+                records.append(0)
+                write_bytes(records, key)
+                updates.append((key, None))
+            else:
+                records.append(1)
+                write_bytes(records, key)
+                write_varint(records, len(value))
+                updates.append((key, (len(records), len(value))))  # offset in the batch
+                records += value
+
+        batch = bytearray()
+        write_varint(batch, len(records))
+        base = self.end + len(batch)
+        batch += records
+        self.file.write(batch)
+        self.file.flush()
+        self.end += len(batch)
+
+        for key, entry in updates:
+            if entry is None:
+                self.index.pop(key, None)
+                self.keys = None
+            else:
+                if key not in self.index:
+                    self.keys = None
+                self.index[key] = (base + entry[0], entry[1])
+
+    def _iter(self, start, end, include_value=True):
+        return _iter_sorted(self, self.index, start, end, include_value)
+
+
+BACKENDS = {
+    "dict": DictDB,
+    "leveldb": LevelDB,
+    "sqlite": SqliteDB,
+    "log": LogDB,
+}
+
+# the backends whose modules are installed
+AVAILABLE_BACKENDS = [name for name, kv in BACKENDS.items() if kv.available]
+
+# leveldb if its installed else in memory (the chains' default)
+DEFAULT_BACKEND = "leveldb" if LevelDB.available else "dict"
+
+
+# (creates the directory the db lives in, the in-memory db has no files)
+# raises ValueError for an unknown backend or one which isnt installed
+def open_db(backend, path, resume=True) -> KV:
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend} (available: {', '.join(AVAILABLE_BACKENDS)})")
+    if not BACKENDS[backend].available:
+        raise ValueError(f"backend {backend} is not installed (available: {', '.join(AVAILABLE_BACKENDS)})")
+    if BACKENDS[backend] is not DictDB:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return BACKENDS[backend](path, resume)
+
+
+# background mark-and-sweep of a db: keeps the keys mark(roots) returns (eg,
+# the nodes reachable from the last N state roots + pinned roots) and deletes
+# every other key under the prefixes
+# writers are never blocked for the whole collection: keys written after
+# `start` are recorded (write barrier) and never swept, so the mark + the
+# listing of the keys run without the lock and only the sweep's small
+# delete batches take the db's write lock
+# NOTE: one pruner per db (the barrier is per db)
+class Pruner:
+    def __init__(self, db: KV, mark, prefixes=(b"",), batch_size=1024) -> None:
+        self.db = db
+        self.mark = mark
+        self.prefixes = prefixes
+        self.batch_size = batch_size
+        self.thread = None
+        self.pruned = 0  # n keys deleted so far
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # starts a collection in a background thread (False if one is still running)
+    def start(self, roots) -> bool:
+        if self.running():
+            return False
+        with self.db.lock:
+            self.db.barrier = set()
+        self.thread = threading.Thread(target=self.collect, args=(list(roots),), daemon=True)
+        self.thread.start()
+        return True
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def collect(self, roots):
+        db = self.db
+        try:
+            live = self.mark(roots)
+            for prefix in self.prefixes:
+                keys = list(db.iter_prefix(prefix, include_value=False))
+                for i in range(0, len(keys), self.batch_size):
+                    with db.lock:
+                        dead = [
+                            (key, None)
+                            for key in keys[i : i + self.batch_size]
+                            if key not in live and key not in db.barrier
+                        ]
+                        db._write(dead)
+                    self.pruned += len(dead)
+        finally:
+            with db.lock:
+                db.barrier = None
 
 
 from dataclasses import dataclass
 from copy import deepcopy
-import json
 
 
 @dataclass
 class Block:
     parent_hash: bytes
     state_root: bytes
+    tx_root: bytes = bytes(0)
     block_hash: bytes = None
 
     def __post_init__(self):
-        self.block_hash = hash([self.parent_hash, self.state_root])
+        self.block_hash = hash([self.parent_hash, self.tx_root, self.state_root])
+
+
+# block store for a tree of blocks (forks): blocks by hash + parent links,
+# per-height indexes and binary lifting pointers (the 2^k-th ancestor of each
+# block) so the ancestor at any height is found in O(log n) jumps
+# the head is a pointer to a block so switching forks is O(1)
+class BlockTree:
+    def __init__(self, genesis) -> None:
+        self.blocks = {}  # block_hash => block
+        self.heights = {}  # block_hash => height
+        self.by_height = []  # height => [block hashes] (every fork)
+        self.jumps = {}  # block_hash => [parent, 2nd, 4th, ..., 2^k-th ancestor]
+        self.add(genesis)
+        self.head = genesis
+
+    # adds a block whose parent is already in the tree (or the genesis)
+    def add(self, block):
+        block_hash = block.block_hash
+        if block_hash in self.blocks:
+            return self.blocks[block_hash]
+
+        if not self.blocks:  # genesis
+            height, jumps = 0, []
+        else:
+            parent = block.parent_hash
+            if parent not in self.blocks:
+                raise KeyError(f"unknown parent {parent.hex()}")
+            height = self.heights[parent] + 1
+            jumps = [parent]
+            # 2^k-th ancestor = the 2^(k-1)-th ancestor of the 2^(k-1)-th ancestor
+            while len(self.jumps[jumps[-1]]) >= len(jumps):
+                jumps.append(self.jumps[jumps[-1]][len(jumps) - 1])
+
+        self.blocks[block_hash] = block
+        self.heights[block_hash] = height
+        self.jumps[block_hash] = jumps
+        if height == len(self.by_height):
+            self.by_height.append([])
+        self.by_height[height].append(block_hash)
+        return block
+
+    def get(self, block_hash):
+        return self.blocks.get(block_hash)
+
+    def height(self, block=None) -> int:
+        return self.heights[(block or self.head).block_hash]
+
+    def set_head(self, block):
+        assert block.block_hash in self.blocks
+        self.head = block
+
+    # block's ancestor at `height` (on block's fork)
+    def ancestor(self, block, height):
+        block_hash = block.block_hash
+        distance = self.heights[block_hash] - height
+        if distance < 0:
+            return None
+        k = 0
+        while distance:
+            if distance & 1:
+                block_hash = self.jumps[block_hash][k]
+            distance >>= 1
+            k += 1
+        return self.blocks[block_hash]
+
+    # the block at `height` on the fork of head (default: the current head)
+    def at_height(self, height, head=None):
+        return self.ancestor(head or self.head, height)
+
+    # is a (or a block hash) on b's fork at/below b
+    def is_ancestor(self, a, b) -> bool:
+        a_hash = a if type(a) is bytes else a.block_hash
+        ancestor = self.ancestor(b, self.heights[a_hash])
+        return ancestor is not None and ancestor.block_hash == a_hash
+
+    # blocks at `height` on every fork
+    def forks_at(self, height):
+        if height >= len(self.by_height):
+            return []
+        return [self.blocks[block_hash] for block_hash in self.by_height[height]]
+
+    # every block (of every fork) in the last n heights below the head's
+    # (eg, the states a pruner keeps so the competing forks can still be reorged to)
+    def recent(self, n):
+        height = self.height()
+        return [block for h in range(max(height - n + 1, 0), height + 1) for block in self.forks_at(h)]
+
+    def __contains__(self, block_hash):
+        return block_hash in self.blocks
+
+    def __len__(self):
+        return len(self.blocks)
 
 
 @dataclass
@@ -121,41 +826,62 @@ class Transaction:
     amount: int
 
     def hash(self):
-        return hash([bytes(self.address, "utf-8"), bytes(self.amount)])
+        return hash(self.serialize())
 
+    # length-prefixed address + varint amount
     def serialize(self):
-        return bytes(json.dumps(self.__dict__), "utf-8")
+        out = bytearray()
+        write_str(out, self.address)
+        write_varint(out, self.amount)
+        return bytes(out)
 
     @staticmethod
     def deserialize(data):
-        data = json.loads(data.decode("utf-8"))
-        tx = Transaction(data["address"], data["amount"])
+        buf = memoryview(data)
+        address, offset = read_str(buf, 0)
+        amount, offset = read_varint(buf, offset)
+        tx = Transaction(address, amount)
         return tx
 
 
+# merkle root over a batch of txs (in block order)
+def tx_root(txs: list[Transaction]):
+    tree = MerkleTree(sort=False)
+    for tx in txs:
+        tree.insert(tx.serialize())
+    return tree.root
+
+
 @dataclass
 class Account:
     address: str
     amount: int
 
+    # raw 32 byte hash of the serialized account
     def hash(self):
-        return hexhash([bytes(self.address, "utf-8"), bytes(self.amount)])
+        return hash(self.serialize())
 
     def hash_bytes(self):
-        return bytes(self.hash(), "utf-8")
+        return self.hash()
 
     def apply(self, tx: Transaction):
         assert self.address == tx.address
         self.amount = tx.amount
         return self
 
+    # length-prefixed address + varint amount
     def serialize(self):
-        return bytes(json.dumps(self.__dict__), "utf-8")
+        out = bytearray()
+        write_str(out, self.address)
+        write_varint(out, self.amount)
+        return bytes(out)
 
     @staticmethod
     def deserialize(data):
-        data = json.loads(data.decode("utf-8"))
-        tx = Account(data["address"], data["amount"])
+        buf = memoryview(data)
+        address, offset = read_str(buf, 0)
+        amount, offset = read_varint(buf, offset)
+        tx = Account(address, amount)
         return tx
 
 
@@ -171,10 +897,88 @@ if __name__ == "__main__":
     tree.insert(b"hi")
     tree.commit()
     root2 = tree.root
-    root2 == root1
+    assert root2 == root1
+
+    # root is cached until the next insert/remove
+    tree.insert(b"again")
+    tree.remove(b"again")
+    assert tree.root == root1
+
+    # one hash selection for the engines + the tree code
+    for name in HASHES:
+        set_hash(name)
+        assert hash_many([b"hi", [b"hi", b"there"]]) == [hash(b"hi"), hash(b"hithere")]
+        assert hashing.hasher() is HASHES[name]
+        assert len(hash(b"hi")) == 32
+    set_hash("sha256")
 
     data = Transaction("dog", 10).serialize()
     tx = Transaction.deserialize(data)
+    assert tx == Transaction("dog", 10)
+
+    data = Account("dog", 2**70).serialize()
+    assert Account.deserialize(data) == Account("dog", 2**70)
+
+    # fork at height 2: genesis - 1 - 2 - 3
+    #                              \- 2' - 3' - 4'
+    genesis = Block(bytes(0), hash(b"0"))
+    blocks = BlockTree(genesis)
+    main = [genesis]
+    for i in range(1, 4):
+        main.append(blocks.add(Block(main[-1].block_hash, hash(b"main%d" % i))))
+    fork = [main[1]]
+    for i in range(2, 5):
+        fork.append(blocks.add(Block(fork[-1].block_hash, hash(b"fork%d" % i))))
+    blocks.set_head(fork[-1])
+    assert blocks.height() == 4 and blocks.at_height(2) == fork[1]
+    assert blocks.at_height(2, main[-1]) == main[2]
+    assert blocks.at_height(1) == main[1] and blocks.at_height(5) is None
+    assert blocks.is_ancestor(main[1], fork[-1]) and not blocks.is_ancestor(main[2], fork[-1])
+    assert len(blocks.forks_at(3)) == 2
+
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    for backend in AVAILABLE_BACKENDS:
+        db = open_db(backend, os.path.join(tmp, backend + ".db"))
+        assert db.get(b"missing") is None
+        db.put_many([(b"a1", b"1"), (b"a2", b"2"), (b"b1", b"3")])
+        assert db.get_many([b"a1", b"b1", b"c"]) == [b"1", b"3", None]
+        assert [bytes(k) for k, _ in db.iter_prefix(b"a")] == [b"a1", b"a2"]
+        assert [bytes(k) for k in db.iter_range(b"a2", b"b1", include_value=False)] == [b"a2"]
+
+        # buffered writes are visible to gets but only flushed at the end
+        with db.buffered():
+            db.put(b"c1", b"4")
+            db.delete(b"a1")
+            assert db.get(b"c1") == b"4" and db.get(b"a1") is None
+            assert db._get(b"a1") == b"1"
+        assert db.get(b"a1") is None and db.get(b"c1") == b"4"
+
+        # nothing is written if the block raises
+        try:
+            with db.buffered():
+                db.put(b"d1", b"5")
+                raise ValueError
+        except ValueError:
+            pass
+        assert db.get(b"d1") is None
+
+        # dict-style access
+        db[b"e1"] = b"6"
+        assert db[b"e1"] == b"6" and b"e1" in db and b"e2" not in db
+
+    # a backend which isnt installed isnt silently swapped for another
+    if "leveldb" not in AVAILABLE_BACKENDS:
+        try:
+            open_db("leveldb", os.path.join(tmp, "leveldb.db"))
+            assert False
+        except ValueError:
+            pass
+
+    # the log is replayed on reopen
+    db = open_db("log", os.path.join(tmp, "log.db"))
+    assert db.get(b"a1") is None and db.get(b"c1") == b"4" and db[b"e1"] == b"6"
 
     # state = State()
     # state.process_tx(tx)
@@ -1,71 +1,153 @@
 #%%
 from utils import *
+import os
 
-# dict state -> used in v1 and v2
+def encode_amount(amount):
+    out = bytearray()
+    write_varint(out, amount)
+    return bytes(out)
+
+
+def decode_amount(data):
+    return read_varint(memoryview(data), 0)[0]
+
+
+# state -> a version of a persistent map (address => amount) which shares every
+# unchanged node with its parent's version (see PersistentMap) so a block only
+# stores the nodes on the paths of the changed accounts
+# the map's nodes are stored under their hashes so its root is the merkle
+# root of the state: a block re-hashes O(changed * log16 n) nodes, whatever
+# the state's size or fork (no separate tree to keep in sync or rebuild)
 class State:
-    def __init__(self) -> None:
-        self.state = {}  # address => account
+    def __init__(self, accounts: PersistentMap, root=EMPTY_ROOT) -> None:
+        self.accounts = accounts
+        self.root = root  # map version
 
-    def process_tx(self, tx: Transaction):
-        self.state[tx.address] = tx.amount
+    # applies a batch of txs (the last tx per address wins) with one map update
+    def process_txs(self, txs: list[Transaction]):
+        updates = {tx.address: encode_amount(tx.amount) for tx in txs}
+        self.root = self.accounts.update(self.root, updates)
 
-    def generate_merkle_tree(self) -> MerkleTree:
-        tree = MerkleTree()
-        for address, amount in self.state.items():
-            tree.insert([bytes(address, "utf-8"), bytes(amount)])
-        tree.commit()
-        return tree
+    def generate_merkle_root(self) -> bytes:
+        return self.root
 
     def get(self, address):
-        return self.state.get(address, None)
+        amount = self.accounts.get(self.root, address)
+        return None if amount is None else decode_amount(amount)
 
+    # a state is stored as a pointer to its map version
     def serialize(self):
-        return bytes(json.dumps(self.state), "utf-8")
+        return self.root
 
     @staticmethod
-    def deserialize(data):
-        data = json.loads(data.decode("utf-8"))
-        state = State()
-        state.state = data
-        return state
+    def deserialize(data, accounts: PersistentMap):
+        return State(accounts, bytes(data))
 
     def __repr__(self) -> str:
-        return self.state.__repr__()
+        return f"State({self.root.hex()})"
 
 
 class Blockchain:
-    def __init__(self) -> None:
-        self.db = DB("blocks.db", resume=False)
-        self.state = State()
-        state_root = self.state.generate_merkle_tree().root
+    # path: the directory of the chain's db (wiped on start)
+    def __init__(self, backend=DEFAULT_BACKEND, keep=None, path="v1-db") -> None:
+        # db: b"s" + state_root => map root, b"n" + node id => map node
+        self.db = open_db(backend, os.path.join(path, "blocks.db"), resume=False)
+        self.accounts = PersistentMap(self.db, prefix=b"n")
+        self.state = State(self.accounts)  # the head's state
+        state_root = self.state.generate_merkle_root()
         genesis = Block(bytes(0), state_root)
-        self.db.put(state_root, self.state.serialize())
-
-        # NOTE: this doesnt support forks
-        self.chain = [genesis]
-
-    def get_account(self, address):
-        state = State.deserialize(self.db.get(self.chain[-1].state_root))
-        return state.get(address)
+        self.db.put(b"s" + state_root, self.state.serialize())
+
+        # forks share every unchanged map node so any block can be extended
+        self.blocks = BlockTree(genesis)
+
+        # pruning: only the states of the last `keep` blocks (of the head's
+        # fork) + pinned states are kept (None = keep every state)
+        self.keep = keep
+        self.pinned = set()  # state roots
+        self.pruner = Pruner(self.db, self._mark, prefixes=(b"s", b"n"))
+
+    @property
+    def head(self):
+        return self.blocks.head
+
+    def _state(self, block):
+        if block.block_hash == self.head.block_hash:
+            return self.state
+        data = self.db.get(b"s" + block.state_root)
+        if data is None:
+            raise KeyError(f"state {block.state_root.hex()} was pruned")
+        return State.deserialize(data, self.accounts)
+
+    # account amount at a block (default: the head)
+    def get_account(self, address, block=None):
+        return self._state(block or self.head).get(address)
+
+    # account amount at a height on the fork of head (default: the current head)
+    def get_account_at(self, address, height, head=None):
+        block = self.blocks.at_height(height, head)
+        return None if block is None else self.get_account(address, block)
+
+    # O(1): the new head's state is a map version (the next block on it only
+    # re-hashes its changed accounts' paths)
+    def set_head(self, block):
+        self.state = self._state(block)
+        self.blocks.set_head(block)
+
+    # keeps a block's state when pruning
+    def pin(self, block):
+        self.pinned.add(block.state_root)
+
+    def unpin(self, block):
+        self.pinned.discard(block.state_root)
+
+    # starts a background collection of the unreachable states/nodes
+    # (False if every state is kept or a collection is still running)
+    def prune(self) -> bool:
+        if self.keep is None:
+            return False
+        roots = [block.state_root for block in self.blocks.recent(self.keep)]
+        return self.pruner.start(roots + list(self.pinned))
+
+    # (runs in the pruner) db keys of the states + their map nodes
+    # (a pinned state which was already pruned is skipped)
+    def _mark(self, state_roots):
+        live, map_roots = set(), []
+        for state_root in state_roots:
+            data = self.db.get(b"s" + state_root)
+            if data is not None:
+                live.add(b"s" + state_root)
+                map_roots.append(bytes(data))
+        return self.accounts.reachable(map_roots, live)
 
     def process_tx(self, tx: Transaction):
-        parent = self.chain[-1]
+        return self.process_block([tx])
 
-        # create the new state
-        # NOTE: this is expensive state cloning (in terms of full account data cloning)
-        state: State = State.deserialize(self.db.get(parent.state_root))
-        state.process_tx(tx)
+    # one block for a batch of txs: one state update + one merkle commit + one db write
+    # on top of parent (default: the head), the longest fork is the head
+    def process_block(self, txs: list[Transaction], parent=None):
+        parent = parent or self.head
 
-        # generate the merkle tree
-        # NOTE: this is expensive re-creating the merkle tree
-        tree = state.generate_merkle_tree()
-        state_root = tree.root
-        self.db.put(state_root, state.serialize())
+        # create the new state
+        # the new version only writes (+ hashes) the changed accounts' paths
+        # (no full state clone) on any fork, the block's node writes are
+        # flushed once as one batch
+        state: State = self._state(parent)
+        with self.db.buffered():
+            state.process_txs(txs)
+            state_root = state.generate_merkle_root()
+            self.db.put(b"s" + state_root, state.serialize())
 
         # create the block
-        # NOTE: this needs the transaction root too
-        block = Block(parent.block_hash, state_root)
-        self.chain.append(block)
+        block = self.blocks.add(Block(parent.block_hash, state_root, tx_root(txs)))
+        if parent.block_hash == self.head.block_hash or self.blocks.height(block) > self.blocks.height():
+            self.state = state
+            self.blocks.set_head(block)
+
+        # collect about once every `keep` blocks (doesnt wait for it)
+        if self.keep is not None and self.blocks.height(block) % self.keep == 0:
+            self.prune()
+        return block
 
 
 if __name__ == "__main__":
@@ -79,3 +161,62 @@ if __name__ == "__main__":
     tx = Transaction("dog", 20)
     chain.process_tx(tx)
     print(chain.get_account("dog"))
+
+    # historical state
+    assert chain.get_account_at("dog", 1) == 10
+    assert chain.get_account_at("dog", 0) == None
+
+    # batched block: last write per address wins
+    chain.process_block([Transaction("cat", 1), Transaction("dog", 30), Transaction("cat", 2)])
+    assert chain.get_account("cat") == 2
+    assert chain.get_account("dog") == 30
+    assert chain.get_account_at("dog", 2) == 20
+    assert chain.head.tx_root == tx_root([Transaction("cat", 1), Transaction("dog", 30), Transaction("cat", 2)])
+
+    # fork from height 1: the longer fork becomes the head, both stay readable
+    fork = chain.process_block([Transaction("dog", 11)], parent=chain.blocks.at_height(1))
+    assert chain.head.state_root != fork.state_root and chain.get_account("dog") == 30
+    fork = chain.process_block([Transaction("cow", 1)], parent=fork)
+    fork = chain.process_block([Transaction("cow", 2)], parent=fork)
+    assert chain.head is fork and chain.get_account("dog") == 11
+    assert chain.get_account_at("dog", 2) == 11
+    main = chain.blocks.forks_at(3)[0]
+    chain.set_head(main)
+    assert chain.get_account("dog") == 30 and chain.get_account("cow") == None
+    chain.process_block([Transaction("cat", 3)])
+    assert chain.get_account("cat") == 3 and chain.get_account_at("dog", 2) == 20
+
+    # pruning: only the last 2 states + the pinned genesis state are kept
+    pruned = Blockchain(backend="dict", keep=2)
+    pruned.pin(pruned.head)
+    for amount in range(10):
+        pruned.process_block([Transaction("dog", amount), Transaction(str(amount), amount)])
+    pruned.prune()
+    pruned.pruner.wait()
+    assert pruned.pruner.pruned > 0
+    assert pruned.get_account("dog") == 9 and pruned.get_account_at("dog", 9) == 8
+    assert pruned.get_account_at("dog", 0) == None
+    try:
+        pruned.get_account_at("dog", 5)
+        assert False
+    except KeyError:
+        pass
+    assert Blockchain(backend="dict").prune() is False  # keep=None: nothing to collect
+
+    # a competing fork inside the keep window survives the collections its own blocks start
+    forked = Blockchain(backend="dict", keep=4)
+    for amount in range(8):
+        forked.process_block([Transaction("dog", amount)])
+    main, fork = forked.head, forked.blocks.at_height(6)
+    for amount in range(3):
+        fork = forked.process_block([Transaction("cat", amount)], parent=fork)
+        forked.pruner.wait()
+    assert forked.head is fork and forked.get_account("cat") == 2
+    assert forked.get_account("dog") == 5 and forked.get_account("dog", main) == 7
+    # a pinned state which is already gone is skipped by the mark
+    assert forked._mark([forked.blocks.at_height(2).state_root]) == set()
+
+    # the root only depends on the accounts: == a map built in one update
+    fresh = PersistentMap(DictDB())
+    amounts = {address: encode_amount(chain.get_account(address)) for address in ["cat", "dog"]}
+    assert fresh.update(EMPTY_ROOT, amounts) == chain.head.state_root
@@ -1,5 +1,10 @@
 #%%
 from utils import *
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import zlib
 
 @dataclass
 class Block:
@@ -11,119 +16,434 @@ class Block:
     def __post_init__(self):
         self.block_hash = hash([self.parent_hash, self.tx_root, self.state_root])
 
+# state -> accounts in fixed slots: an address keeps the position it was first
+# inserted at so an update only replaces its slot (+ re-hashes that slot's
+# path in the positional merkle tree) instead of scanning/re-ordering a list
 class State:
-    db = DB("state.db")
-
-    def __init__(self, account_hashes=[]) -> None:
-        self.account_hashes = account_hashes
+    def __init__(self, db: KV) -> None:
+        self.db = db  # account hash => account
+        self.index = {}  # address => (position, raw 32 byte account hash)
+        self.addresses = []  # position => address
+        self.tree = MerkleTree(sort=False)  # account hashes by position
 
     def put_account(self, account: Account):
         self.db.put(account.hash_bytes(), account.serialize())
 
-    def set_account_hashes(self, account_hashes):
-        self.account_hashes = account_hashes
+    def put_accounts(self, accounts):
+        self.db.put_many([(account.hash_bytes(), account.serialize()) for account in accounts])
+
+    def get(self, address):
+        return self.index.get(address)
+
+    # points address's slot to the account + returns the slot's position
+    def set_account(self, account: Account):
+        entry = self.index.get(account.address)
+        position = len(self.addresses) if entry is None else entry[0]
+        self.set_slot(position, account.hash(), account.address)
+        return position
+
+    # position == n_slots appends a new slot
+    def set_slot(self, position, h, address):
+        if position == len(self.addresses):
+            self.addresses.append(address)
+            self.tree.insert(h)
+        else:
+            self.tree.update(position, h)
+        self.index[address] = (position, h)
+
+    # removes the last slot (undoing an append when switching forks)
+    def pop_slot(self):
+        address = self.addresses.pop()
+        del self.index[address]
+        self.tree.truncate(len(self.addresses))
 
     def generate_merkle_root(self):
-        # list of (hash, address) we group hash the hashes
-        return hash([bytes(h, "utf-8") for h, _ in self.account_hashes])
+        return self.tree.root
 
-    def serialize(self):
-        return bytes(json.dumps(self.account_hashes), "utf-8")
+    # versioned layout: a block only stores the slots it changed
+    # varint height + varint n_slots + n * (varint position + raw 32 byte hash + length-prefixed address)
+    @staticmethod
+    def serialize_delta(height, slots):
+        out = bytearray()
+        write_varint(out, height)
+        write_varint(out, len(slots))
+        for position, h, address in slots:
+            write_varint(out, position)
+            out += h
+            write_str(out, address)
+        return bytes(out)
 
     @staticmethod
-    def deserialize(data):
-        data = json.loads(data.decode("utf-8"))
-        state = State()
-        state.account_hashes = data
-        return state
+    def deserialize_delta(data):
+        buf = memoryview(data)
+        height, offset = read_varint(buf, 0)
+        n, offset = read_varint(buf, offset)
+        slots = []
+        for _ in range(n):
+            position, offset = read_varint(buf, offset)
+            h = bytes(buf[offset : offset + HASH_SIZE])
+            address, offset = read_str(buf, offset + HASH_SIZE)
+            slots.append((position, h, address))
+        return height, slots
+
+
+# snapshots: the head state in chunks of slots (in position order), each one
+# zlib-compressed with a range proof against the state root (see MerkleTree.prove_range)
+#   chunk: varint n_slots (of the state) + varint first position + varint n
+#          + n * length-prefixed account + varint n_proof + n_proof * raw 32 byte hash
+def encode_chunk(n_slots, lo, records, proof):
+    out = bytearray()
+    write_varint(out, n_slots)
+    write_varint(out, lo)
+    write_varint(out, len(records))
+    for record in records:
+        write_bytes(out, record)
+    write_varint(out, len(proof))
+    for h in proof:
+        out += h
+    return zlib.compress(bytes(out))
+
+
+def decode_chunk(chunk):
+    buf = memoryview(zlib.decompress(chunk))
+    n_slots, offset = read_varint(buf, 0)
+    lo, offset = read_varint(buf, offset)
+    n, offset = read_varint(buf, offset)
+    records = []
+    for _ in range(n):
+        record, offset = read_bytes(buf, offset)
+        records.append(bytes(record))
+    n, offset = read_varint(buf, offset)
+    proof = [bytes(buf[i : i + HASH_SIZE]) for i in range(offset, offset + n * HASH_SIZE, HASH_SIZE)]
+    return n_slots, lo, records, proof
+
+
+# (runs in a worker) the chunk's (n_slots, first position, accounts), raises ValueError on a bad chunk
+def verify_chunk(state_root, chunk):
+    n_slots, lo, records, proof = decode_chunk(chunk)
+    # slot leaf = hash(account hash)
+    leafs = hash_many(hash_many(records))
+    if not verify_range(state_root, n_slots, lo, leafs, proof):
+        raise ValueError("invalid chunk: bad range proof")
+    return n_slots, lo, [Account.deserialize(record) for record in records]
+
+
+# verifies the chunks in a process pool as they're read, yields their (n_slots, first position, accounts) in chunk order
+# at most `window` chunks (default: 2 per worker) are read + not yet yielded,
+# so a snapshot is never held in memory
+def verify_chunks(state_root, chunks, workers=None, window=None):
+    window = window or 2 * (workers or os.cpu_count())
+    ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append(pool.submit(verify_chunk, state_root, chunk))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:  # (a bad chunk stops the import)
+                future.cancel()
 
 
 class Blockchain:
-    def __init__(self) -> None:
-        # init state/genesis block
-        state = State()
-        state_root = state.generate_merkle_root()
+    # path: the directory of the chain's dbs (wiped on start)
+    def __init__(self, cache_size=4096, backend=DEFAULT_BACKEND, keep=None, path="v2-db") -> None:
+        # account records by hash (shared across historical lookups)
+        self.cache = LRUCache(cache_size)
 
-        self.db = DB("blocks.db", resume=False)
-        self.db.put(state_root, state.serialize())
+        # head state (index + merkle tree) is kept in memory and updated in place
+        self.state = State(open_db(backend, os.path.join(path, "state.db"), resume=False))
+        # address => [(height, block hash, account hash)] (ascending heights, every fork)
+        self.history = {}
 
-        # NOTE: this doesnt support forks
+        # init state/genesis block
+        state_root = self.state.generate_merkle_root()
         genesis = Block(bytes(0), state_root, bytes(0))
-        self.chain: list[Block] = [genesis]
+        self.blocks = BlockTree(genesis)
+
+        # db: b"s" + block_hash => the slots the block changed
+        self.db = open_db(backend, os.path.join(path, "blocks.db"), resume=False)
+        self.db.put(b"s" + genesis.block_hash, State.serialize_delta(0, []))
+
+        # pruning: only the states of the last `keep` blocks (of the head's
+        # fork) + pinned states are kept (None = keep every state)
+        self.keep = keep
+        self.pinned = set()  # block hashes
+        self.live_entries = None  # (address, block hash)s of the history entries the last collection kept
+        self.pruners = [
+            Pruner(self.db, self._mark_deltas, prefixes=(b"s",)),
+            Pruner(self.state.db, self._mark_accounts),
+        ]
+
+    @property
+    def head(self):
+        return self.blocks.head
 
     def get_account(self, address) -> Account:
-        head = self.chain[-1]
-        return self.get_account_block(address, head)
+        return self.get_account_block(address, self.head)
+
+    # account at a height on the fork of head (default: the current head)
+    def get_account_at(self, address, height, head=None) -> Account:
+        block = self.blocks.at_height(height, head)
+        return None if block is None else self.get_account_block(address, block)
 
     def get_account_block(self, address, block) -> Account:
-        # lookup parent block's state
-        state = State.deserialize(self.db.get(block.state_root))
-        state_account_hashes = state.account_hashes
+        if self.db.get(b"s" + block.block_hash) is None:
+            raise KeyError(f"state {block.block_hash.hex()} was pruned")
 
-        # find account
-        address_hash = [h for (h, addr) in state_account_hashes if addr == address]
-        if len(address_hash) == 0:
+        address_hash = self._account_hash(address, block)
+        if address_hash is None:
             return None
-        assert len(address_hash) == 1
-        address_hash = address_hash[0]
-
-        account = state.db.get(bytes(address_hash, "utf-8"))
-        account = Account.deserialize(account)
 
-        return account
+        # the cache keeps the immutable records: each read decodes its own
+        # Account (callers can apply txs to it without changing the history)
+        data = self.cache.get(address_hash, lambda h: bytes(self.state.db.get(h)))
+        return Account.deserialize(data)
+
+    # the account's latest version at/below the block on the block's fork
+    def _account_hash(self, address, block):
+        entry = self._account_entry(address, block)
+        return None if entry is None else entry[2]
+
+    # its (height, block hash, account hash) history entry
+    def _account_entry(self, address, block):
+        history = self.history.get(address, [])
+        i = bisect.bisect_right(history, self.blocks.height(block), key=lambda entry: entry[0])
+        # walks down from the latest version (no copy of the list: the head's
+        # version is usually found in the first step)
+        for j in range(i - 1, -1, -1):
+            entry = history[j]
+            if self.blocks.is_ancestor(entry[1], block):
+                return entry
+        return None
+
+    def _delta(self, block):
+        data = self.db.get(b"s" + block.block_hash)
+        if data is None:
+            raise KeyError(f"state {block.block_hash.hex()} was pruned")
+        return State.deserialize_delta(data)[1]
+
+    # lazily yields (kind, address, old account, new account) for kind in
+    # 'added', 'removed', 'modified' from block_a's state to block_b's in address order
+    # only the deltas of the blocks back to their common ancestor are read
+    # (O(changes), not O(state))
+    def diff(self, block_a, block_b):
+        path_a, path_b = self._path(block_a, block_b)
+        addresses = set()
+        for block in path_a + path_b:
+            addresses.update(address for _, _, address in self._delta(block))
+
+        for address in sorted(addresses):
+            old = self.get_account_block(address, block_a)
+            new = self.get_account_block(address, block_b)
+            if old is None and new is not None:
+                yield "added", address, None, new
+            elif old is not None and new is None:
+                yield "removed", address, old, None
+            elif old is not None and old != new:
+                yield "modified", address, old, new
+
+    # the blocks from a + from b down to (not including) their common ancestor
+    def _path(self, a, b):
+        path_a, path_b = [], []
+        while a.block_hash != b.block_hash:
+            if self.blocks.height(a) >= self.blocks.height(b):
+                path_a.append(a)
+                a = self.blocks.get(a.parent_hash)
+            else:
+                path_b.append(b)
+                b = self.blocks.get(b.parent_hash)
+        return path_a, path_b
+
+    # switches the head's state to another fork: undoes the old fork's
+    # deltas back to the common ancestor + redoes the new fork's
+    # (O(blocks reorged), the blocks stay in the tree)
+    def set_head(self, block):
+        undo, redo = self._path(self.head, block)
+        state = self.state
+        for undone in undo:
+            parent = self.blocks.get(undone.parent_hash)
+            for position, _, address in reversed(self._delta(undone)):
+                h = self._account_hash(address, parent)
+                if h is None:
+                    state.pop_slot()  # the slot was added by the block
+                else:
+                    state.set_slot(position, h, address)
+        for redone in reversed(redo):
+            for position, h, address in self._delta(redone):
+                state.set_slot(position, h, address)
+        self.blocks.set_head(block)
+
+    # keeps a block's state when pruning
+    def pin(self, block):
+        self.pinned.add(block.block_hash)
+
+    def unpin(self, block):
+        self.pinned.discard(block.block_hash)
+
+    # starts a background collection of the unreachable states/accounts
+    # (False if every state is kept or a collection is still running)
+    def prune(self) -> bool:
+        if self.keep is None or any(pruner.running() for pruner in self.pruners):
+            return False
+        self._trim_history()
+        blocks = self.blocks.recent(self.keep)
+        blocks += [self.blocks.get(block_hash) for block_hash in self.pinned]
+        for pruner in self.pruners:
+            pruner.start(blocks)
+        return True
+
+    # (runs in the pruner) the blocks' deltas
+    def _mark_deltas(self, blocks):
+        return {b"s" + block.block_hash for block in blocks}
+
+    # (runs in the pruner) the hash of each account at each of the blocks
+    # (+ the history entries they were read from, see _trim_history)
+    def _mark_accounts(self, blocks):
+        live, entries = set(), set()
+        for address in list(self.history):
+            for block in blocks:
+                entry = self._account_entry(address, block)
+                if entry is not None:
+                    live.add(entry[2])
+                    entries.add((address, entry[1]))
+        self.live_entries = entries
+        return live
+
+    # drops the history entries of the last collection's pruned blocks: the
+    # ones whose delta was swept + which no kept block reads (blocks added
+    # since it started, on any fork, kept their deltas so their entries stay)
+    # runs on the writer's thread once the collection is done (process_block
+    # inserts into the same lists + reads need the entries until the sweep)
+    def _trim_history(self):
+        if self.live_entries is None or any(pruner.running() for pruner in self.pruners):
+            return
+        entries, swept = self.live_entries, {}
+        history = {}
+        for address, versions in self.history.items():
+            versions = [entry for entry in versions if (address, entry[1]) in entries or not self._swept(entry[1], swept)]
+            if versions:
+                history[address] = versions
+        self.history = history
+        self.live_entries = None
+
+    # True if the block's delta was pruned (memoized in `swept`)
+    def _swept(self, block_hash, swept):
+        if block_hash not in swept:
+            swept[block_hash] = self.db.get(b"s" + block_hash) is None
+        return swept[block_hash]
+
+    # lazily yields the chunks of the head state
+    def export_snapshot(self, chunk_size=1024):
+        state = self.state
+        n_slots = len(state.addresses)
+        for lo in range(0, n_slots, chunk_size):
+            hi = min(lo + chunk_size, n_slots)
+            hashes = [state.index[address][1] for address in state.addresses[lo:hi]]
+            records = state.db.get_many(hashes)
+            yield encode_chunk(n_slots, lo, records, state.tree.prove_range(lo, hi))
+
+    # starts an empty chain from a snapshot of a state (its genesis state)
+    # the chunks are verified in parallel as they're read (each one written once its verified)
+    # raises ValueError if a chunk or the root is invalid
+    def import_snapshot(self, state_root, chunks, workers=None):
+        assert len(self.blocks) == 1 and len(self.state.index) == 0, "import into an empty chain"
+        state = State(self.state.db)
+
+        n_slots = None
+        for n, lo, accounts in verify_chunks(state_root, chunks, workers):
+            if n_slots is not None and n != n_slots or lo != len(state.addresses):
+                raise ValueError("invalid snapshot: chunks out of order")
+            n_slots = n
+            state.put_accounts(accounts)
+            for account in accounts:
+                state.set_account(account)
+
+        if state.generate_merkle_root() != state_root:
+            raise ValueError("invalid snapshot: root mismatch (missing chunks)")
+
+        # the snapshot is the genesis state
+        genesis = Block(bytes(0), state_root, bytes(0))
+        self.db.delete(b"s" + self.head.block_hash)
+        self.state = state
+        self.blocks = BlockTree(genesis)
+        self.history = {address: [(0, genesis.block_hash, h)] for address, (_, h) in state.index.items()}
+        slots = [(position, h, address) for address, (position, h) in state.index.items()]
+        self.db.put(b"s" + genesis.block_hash, State.serialize_delta(0, slots))
 
     def process_tx(self, tx: Transaction):
-        parent_block = self.chain[-1]
-
-        tx_root = tx.hash()
-
-        # lookup parent block's state
-        state = State.deserialize(self.db.get(parent_block.state_root))
-        state_account_hashes = state.account_hashes
-
-        # find the tx's address account
-        address = tx.address
-        address_hash_index = [
-            i for i, (_, addr) in enumerate(state_account_hashes) if addr == address
-        ]
-
-        if len(address_hash_index) == 0:
-            # account DNE -- init account
-            account = Account(tx.address, tx.amount)
-
-        else:
-            assert len(address_hash_index) == 1
-            # lookup existing account
-            i = address_hash_index[0]
-            address_hash, _ = state_account_hashes[i]
-            account_data = state.db.get(bytes(address_hash, "utf-8"))
-            account = Account.deserialize(account_data)
-
-            # modify account with tx
-            account = account.apply(tx)
+        return self.process_block([tx])
+
+    # one block for a batch of txs: one merkle commit + one state delta write
+    # on top of parent (default: the head), the longest fork is the head
+    def process_block(self, txs: list[Transaction], parent=None):
+        head = self.head
+        parent = parent or head
+        if parent.block_hash != head.block_hash:
+            self.set_head(parent)
+        parent_block = self.head
+
+        # load the txs' existing accounts (O(1) index lookups + one batched read)
+        state = self.state
+        address_hashes = {}
+        for tx in txs:
+            entry = state.get(tx.address)
+            if entry is not None:
+                address_hashes[tx.address] = entry[1]
+        account_data = state.db.get_many(address_hashes.values())
+        accounts = {
+            address: Account.deserialize(data)
+            for address, data in zip(address_hashes, account_data)
+        }
+
+        # apply the txs (the last write per address wins)
+        for tx in txs:
+            account = accounts.get(tx.address)
+            if account is None:
+                # account DNE -- init account
+                account = Account(tx.address, tx.amount)
+            else:
+                # modify account with tx
+                account = account.apply(tx)
+            accounts[tx.address] = account
+
+        # update the accounts' slots + the new state root
+        slots = []
+        state.put_accounts(accounts.values())
+        for address, account in accounts.items():
+            position = state.set_account(account)
+            slots.append((position, account.hash(), address))
+        state_root = state.generate_merkle_root()
 
-            # update state_account_hashes
-            del state_account_hashes[i]
+        # create new block
+        block = self.blocks.add(Block(parent_block.block_hash, state_root, tx_root(txs)))
+        height = self.blocks.height(block)
+        for position, h, address in slots:
+            history = self.history.setdefault(address, [])
+            bisect.insort(history, (height, block.block_hash, h), key=lambda entry: entry[0])
 
-        state.put_account(account)
+        # only the changed slots are stored for the new block
+        self.db.put(b"s" + block.block_hash, State.serialize_delta(height, slots))
+        self.blocks.set_head(block)
 
-        # update new state root
-        state_account_hashes.append((account.hash(), tx.address))
-        new_state = State(state_account_hashes)
-        state_root = new_state.generate_merkle_root()
-        self.db.put(state_root, new_state.serialize())
+        # a side fork which isnt longer than the old head => back to the old head
+        if parent.block_hash != head.block_hash and height <= self.blocks.height(head):
+            self.set_head(head)
 
-        # create new block
-        block = Block(parent_block.block_hash, state_root, tx_root)
-        self.chain.append(block)
+        # collect about once every `keep` blocks (doesnt wait for it)
+        if self.keep is not None and height % self.keep == 0:
+            self.prune()
+        return block
 
 
 if __name__ == "__main__":
     chain = Blockchain()
 
     tx = Transaction("dog", 10)
-    chain.process_tx(tx)
-    dog_block = chain.chain[-1]
+    dog_block = chain.process_tx(tx)
 
     tx = Transaction("cat", 9)
     chain.process_tx(tx)
@@ -137,13 +457,117 @@ if __name__ == "__main__":
 
     # rollbacks for forks
     print("dog @ init", chain.get_account_block("dog", dog_block))
+    print("cache hits/misses:", chain.cache.hits, chain.cache.misses)
+
+    assert chain.get_account_block("dog", dog_block).amount == 10
+
+    # reads are copies: changing one doesnt change the chain's history
+    chain.get_account("dog").apply(Transaction("dog", 99))
+    assert chain.get_account("dog").amount == 20
+    assert chain.get_account_block("dog", dog_block).amount == 10
+    assert chain.get_account_block("cat", dog_block) == None
+    assert chain.get_account("dog").amount == 20
+    assert chain.state.get("dog")[0] == 0  # updated in place
+
+    # batched block: last write per address wins
+    txs = [Transaction("cat", 1), Transaction("cow", 5), Transaction("cat", 2)]
+    chain.process_block(txs)
+    assert chain.get_account("cat").amount == 2
+    assert chain.get_account("cow").amount == 5
+    assert chain.get_account_at("cat", 3).amount == 9
+    assert chain.head.tx_root == tx_root(txs)
+
+    # fork from dog_block: the longer fork becomes the head, both stay readable
+    main = chain.head
+    fork = chain.process_block([Transaction("dog", 11)], parent=dog_block)
+    assert chain.head is main and chain.get_account("dog").amount == 20
+    fork = chain.process_block([Transaction("pig", 1)], parent=fork)
+    fork = chain.process_block([Transaction("pig", 2)], parent=fork)
+    fork = chain.process_block([Transaction("pig", 3)], parent=fork)
+    assert chain.head is fork and chain.get_account("dog").amount == 11
+    assert chain.get_account("cat") == None and chain.get_account("pig").amount == 3
+    assert chain.state.generate_merkle_root() == fork.state_root
+    assert chain.get_account_block("cat", main).amount == 2
+    assert [address for _, address, _, _ in chain.diff(main, fork)] == ["cat", "cow", "dog", "pig"]
+    chain.set_head(main)
+    assert chain.state.generate_merkle_root() == main.state_root
+    assert chain.get_account("dog").amount == 20 and chain.get_account("pig") == None
+
+    # pruning: only the last 2 states + the pinned dog_block state are kept
+    pruned = Blockchain(backend="dict", keep=2)
+    for amount in range(10):
+        pruned.process_block([Transaction("dog", amount), Transaction(str(amount), amount)])
+        if amount == 3:
+            pruned.pin(pruned.head)
+    pruned.prune()
+    for pruner in pruned.pruners:
+        pruner.wait()
+    assert pruned.get_account("dog").amount == 9
+    assert pruned.get_account_at("dog", 9).amount == 8
+    assert pruned.get_account_at("dog", 4).amount == 3
+    assert len(list(pruned.state.db)) == 10 + 3  # (+ dog @ 9, 8, 3)
+    try:
+        pruned.get_account_at("dog", 6)
+        assert False
+    except KeyError:
+        pass
+    # the next collection drops the pruned blocks' history entries
+    pruned.prune()
+    for pruner in pruned.pruners:
+        pruner.wait()
+    assert [height for height, _, _ in pruned.history["dog"]] == [4, 9, 10]
+    assert pruned.get_account_at("dog", 4).amount == 3 and pruned.get_account_at("9", 10).amount == 9
+    assert Blockchain(backend="dict").prune() is False  # keep=None: nothing to collect
+
+    # a competing fork inside the keep window survives the collections its own blocks start
+    forked = Blockchain(backend="dict", keep=4)
+    for amount in range(8):
+        forked.process_block([Transaction("dog", amount)])
+    main, fork = forked.head, forked.blocks.at_height(6)
+    for amount in range(3):
+        fork = forked.process_block([Transaction("cat", amount)], parent=fork)
+        for pruner in forked.pruners:
+            pruner.wait()
+    assert forked.head is fork and forked.get_account("cat").amount == 2
+    assert forked.get_account("dog").amount == 5 and forked.get_account_block("dog", main).amount == 7
+    try:
+        forked.set_head(forked.blocks.at_height(2))  # its delta was pruned
+        assert False
+    except KeyError:
+        pass
+
+    # dog_block => head
+    changes = list(chain.diff(dog_block, chain.head))
+    assert [(kind, address) for kind, address, _, _ in changes] == [
+        ("added", "cat"),
+        ("added", "cow"),
+        ("modified", "dog"),
+    ]
+
+    # snapshot of the head state => new chain with the same state
+    replica = Blockchain(backend="dict")
+    replica.import_snapshot(chain.head.state_root, chain.export_snapshot(chunk_size=2), workers=2)
+    assert replica.get_account("cat").amount == 2
+    assert replica.head.state_root == chain.head.state_root
+    replica.process_block([Transaction("cat", 7)])
+    assert replica.get_account("cat").amount == 7 and replica.get_account_at("cat", 0).amount == 2
+
+    # a tampered chunk is rejected
+    chunks = list(chain.export_snapshot(chunk_size=2))
+    n_slots, lo, records, proof = decode_chunk(chunks[0])
+    records[0] = Account("dog", 1000).serialize()
+    chunks[0] = encode_chunk(n_slots, lo, records, proof)
+    try:
+        Blockchain(backend="dict").import_snapshot(chain.head.state_root, chunks, workers=2)
+        assert False
+    except ValueError:
+        pass
 
-    s = State()
     n_accounts = -1
-    for k in s.db.db.RangeIter(include_value=False):
+    for k in chain.state.db.iter_range(include_value=False):
         n_accounts += 1
         print("key:", k)
-    print("N accounts (dog1, cat1, dog2):", n_accounts)
+    print("N accounts (every version on every fork):", n_accounts)
 
     import time
 
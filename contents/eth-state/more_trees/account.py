@@ -1,29 +1,33 @@
 from dataclasses import dataclass
-from json import loads, dumps
-import hashlib
+from codec import write_varint, read_varint, write_str, read_str
+import hashing
 
 @dataclass
 class Account: 
     amount: int
     address: str 
 
-    def digest16(self): 
-        m = hashlib.sha256()
-        data = bytes(self.serialize(), 'utf-8')
-        m.update(data)
-        digest = m.hexdigest()[:16]
-        return digest
+    # raw digest (hashing.DIGEST_SIZE bytes)
+    def digest(self): 
+        return hashing.hash(self.serialize())
 
-    def serialize(self):
-        return dumps({"amount": self.amount, "address": self.address})
+    # varint amount + length-prefixed address
+    def serialize(self) -> bytes:
+        out = bytearray()
+        write_varint(out, self.amount)
+        write_str(out, self.address)
+        return bytes(out)
 
     @staticmethod
     def deserialize(data): 
-        d = loads(data)
-        account = Account(d['amount'], d['address'])
+        buf = memoryview(data)
+        amount, offset = read_varint(buf, 0)
+        address, offset = read_str(buf, offset)
+        account = Account(amount, address)
         return account
 
-acc = Account(100, 'ball')
-d = acc.serialize()
-print(Account.deserialize(d))
-print(acc.digest16())
+if __name__ == "__main__":
+    acc = Account(100, 'ball')
+    d = acc.serialize()
+    print(Account.deserialize(d))
+    print(acc.digest().hex())
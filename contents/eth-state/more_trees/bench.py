@@ -0,0 +1,131 @@
+# rough benchmarks for the tree impls
+# usage: python bench.py [n_keys]
+from dataclasses import dataclass
+import contextlib
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import patricia_merkle
+import radix
+import radix16
+import trie
+
+def random_keys(n, length=64, seed=0):
+    rng = random.Random(seed)
+    return ['%0*x' % (length, rng.getrandbits(length * 4)) for _ in range(n)]
+
+@contextlib.contextmanager
+def timed(name, n):
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    print(f'{name:<40} {elapsed:8.3f}s  {n / elapsed:12,.0f} keys/s')
+
+def bench_bulk_load(n):
+    keys = random_keys(n)
+    items = sorted((k, 1) for k in keys)
+
+    tree = radix16.Node.default()
+    with timed('radix16 _insert', n):
+        for k in keys:
+            radix16._insert(tree, k, 1)
+
+    with timed('radix16 from_sorted', n):
+        bulk_tree = radix16.from_sorted(items)
+
+    assert bulk_tree == tree
+
+def bench_throughput(name, tree, insert, lookup, keys):
+    n = len(keys)
+    with timed(f'{name} insert', n):
+        for k in keys:
+            insert(tree, k, k)
+
+    with timed(f'{name} lookup', n):
+        for k in keys:
+            lookup(tree, k)
+
+    assert all(lookup(tree, k) == k for k in keys[:1000])
+
+def bench_modules(n):
+    keys = random_keys(n)
+    # trie + radix roots hold the first key so all keys need a common prefix
+    trie_keys = ['0' + k for k in keys]
+    # radix doesnt split on common prefixes so its children are a flat list (O(n) inserts)
+    radix_keys = trie_keys[:n // 10]
+    bench_throughput('trie', trie.Node(None, None, []), trie._insert, trie._lookup, trie_keys)
+    bench_throughput('radix', radix.Node('0', None, [], None), radix._insert, radix._lookup, radix_keys)
+    bench_throughput('radix16', radix16.Node.default(), radix16._insert, radix16._lookup, keys)
+
+def bench_commit(n, workers=(2, 4, 8, 16)):
+    items = sorted((k, bytes.fromhex(k)) for k in random_keys(n))
+
+    tree = radix16.from_sorted(items, patricia_merkle.MerkleNode.default)
+    with timed('MerkleNode commit', n):
+        root = tree.commit({})
+
+    for w in workers:
+        tree = radix16.from_sorted(items, patricia_merkle.MerkleNode.default)
+        with timed(f'MerkleNode commit_parallel({w})', n):
+            assert tree.commit_parallel({}, workers=w) == root
+
+    # on disk: the workers write their records straight to the sqlite file
+    with tempfile.TemporaryDirectory() as tmp:
+        tree = radix16.from_sorted(items, patricia_merkle.MerkleNode.default)
+        with timed('MerkleNode commit (sqlite)', n):
+            assert tree.commit(patricia_merkle.SqliteNodes(os.path.join(tmp, 'serial'))) == root
+
+        for w in workers:
+            path = os.path.join(tmp, f'parallel-{w}')
+            open_db = lambda: patricia_merkle.SqliteNodes(path)
+            tree = radix16.from_sorted(items, patricia_merkle.MerkleNode.default)
+            with timed(f'MerkleNode commit_parallel({w}, sqlite)', n):
+                assert tree.commit_parallel(open_db(), workers=w, open_db=open_db) == root
+
+# the previous list-backed radix16 node layout (kept for comparison)
+@dataclass
+class ListNode:
+    key: str
+    value: any
+    children: list[any]
+
+    @staticmethod
+    def default():
+        return ListNode(None, None, [None] * 16)
+
+    def set_child(self, i, child):
+        self.children[i] = child
+
+    def set_kids(self, bitmap, kids):
+        kids = iter(kids)
+        for i in range(16):
+            if bitmap >> i & 1:
+                self.children[i] = next(kids)
+
+def tree_memory(items, default):
+    gc.collect()
+    tracemalloc.start()
+    tree = radix16.from_sorted(items, default)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+def bench_memory(n):
+    items = sorted((k, 1) for k in random_keys(n))
+    per_million = 1_000_000 / n / 2**20
+    list_size = tree_memory(items, ListNode.default)
+    node_size = tree_memory(items, radix16.Node.default)
+    print(f'{"radix16 ListNode memory":<40} {list_size * per_million:8.1f}MB per 1M keys')
+    print(f'{"radix16 Node memory":<40} {node_size * per_million:8.1f}MB per 1M keys  ({list_size / node_size:.1f}x smaller)')
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    bench_modules(n)
+    bench_commit(n)
+    bench_bulk_load(n)
+    bench_memory(n)
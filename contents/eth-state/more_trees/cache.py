@@ -0,0 +1,41 @@
+# bounded read-through cache in front of a db (evicts the least recently used)
+# keys are content-addressed digests so a cached value never goes stale
+# (eg, the top levels of the tree are shared by every lookup)
+# cached values are shared by every reader: cache immutable data (bytes, or
+# objects which are never mutated) and decode a fresh copy per read otherwise
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # load(key) is called on a miss
+    def get(self, key, load):
+        try:
+            value = self.items[key]
+        except KeyError:
+            self.misses += 1
+            value = load(key)
+            self.items[key] = value
+            if len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+            return value
+
+        self.hits += 1
+        self.items.move_to_end(key)
+        return value
+
+    def __len__(self):
+        return len(self.items)
+
+if __name__ == "__main__":
+    cache = LRUCache(max_size=2)
+    loads = []
+    load = lambda key: loads.append(key) or key * 2
+    assert [cache.get(k, load) for k in [1, 2, 1, 3, 2]] == [2, 4, 2, 6, 4]
+    assert loads == [1, 2, 3, 2] # 2 was evicted by 3 (1 was used more recently)
+    assert (cache.hits, cache.misses, len(cache)) == (1, 4, 2)
+    print('success')
@@ -0,0 +1,51 @@
+# compact binary encoding for db records (tree nodes + the eth-state-py engines, instead of json)
+#   varint: 7 bits per byte, high bit set if more bytes follow (LEB128)
+#   bytes: varint length + raw bytes
+# decoders take a memoryview + offset and return (value, new offset) so fields
+# are read straight out of the record without copying it
+
+def write_varint(out: bytearray, n: int):
+    assert n >= 0
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def read_varint(buf: memoryview, offset: int):
+    n = shift = 0
+    while True:
+        b = buf[offset]
+        offset += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, offset
+        shift += 7
+
+def write_bytes(out: bytearray, data: bytes):
+    write_varint(out, len(data))
+    out += data
+
+def read_bytes(buf: memoryview, offset: int):
+    n, offset = read_varint(buf, offset)
+    return buf[offset:offset + n], offset + n
+
+def write_str(out: bytearray, s: str):
+    write_bytes(out, s.encode('utf-8'))
+
+def read_str(buf: memoryview, offset: int):
+    data, offset = read_bytes(buf, offset)
+    return str(data, 'utf-8'), offset
+
+if __name__ == "__main__":
+    out = bytearray()
+    for n in [0, 1, 127, 128, 300, 2**64]:
+        write_varint(out, n)
+    write_str(out, 'abcde')
+
+    buf, offset = memoryview(bytes(out)), 0
+    for n in [0, 1, 127, 128, 300, 2**64]:
+        x, offset = read_varint(buf, offset)
+        assert x == n
+    s, offset = read_str(buf, offset)
+    assert s == 'abcde' and offset == len(buf)
+    print('success')
@@ -0,0 +1,62 @@
+# hash backend for the tree + account digests + the eth-state-py engines (full 32 byte raw digests)
+# usage: hashing.set_hash('blake2b') before building/committing any trees/chains
+import hashlib
+
+# keccak isnt in hashlib (sha3_256 uses different padding) so its optional
+try:
+    from Crypto.Hash import keccak # pycryptodome
+
+    def keccak256(data):
+        return keccak.new(digest_bits=256, data=data).digest()
+except ImportError:
+    try:
+        import sha3 # pysha3
+
+        def keccak256(data):
+            return sha3.keccak_256(data).digest()
+    except ImportError:
+        keccak256 = None
+
+DIGEST_SIZE = 32
+
+HASHES = {
+    'sha256': lambda data: hashlib.sha256(data).digest(),
+    'blake2b': lambda data: hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest(),
+}
+if keccak256 is not None:
+    HASHES['keccak'] = keccak256
+
+_hash = HASHES['sha256']
+
+def set_hash(name: str):
+    global _hash
+    if name not in HASHES:
+        raise ValueError(f'unknown hash {name} (available: {", ".join(HASHES)})')
+    _hash = HASHES[name]
+
+# the selected raw hash function (eg, for a tight loop of hashes)
+def hasher():
+    return _hash
+
+# data: bytes or a list of bytes (hashed as their concatenation)
+def hash(data) -> bytes:
+    if type(data) == list:
+        data = b''.join(data)
+    return _hash(data)
+
+def hexhash(data) -> str:
+    return hash(data).hex()
+
+# hashes a batch of items (eg, all the dirty nodes on one level of a tree)
+def hash_many(items) -> list[bytes]:
+    h = _hash
+    return [h(b''.join(data) if type(data) == list else data) for data in items]
+
+if __name__ == "__main__":
+    for name in HASHES:
+        set_hash(name)
+        digests = hash_many([b'a', b'b'])
+        assert digests == [hash(b'a'), hash(b'b')]
+        assert len(digests[0]) == DIGEST_SIZE
+        assert hash([b'a', b'b']) == hash(b'ab') == hash_many([[b'a', b'b']])[0]
+        print(name, digests[0].hex())
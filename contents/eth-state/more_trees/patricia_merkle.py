@@ -1,8 +1,14 @@
-from radix16 import _insert, Node
+from radix16 import _insert, _lookup, Node, HEX_VALUES
+from walk import walk
 from account import Account
+from codec import write_bytes, read_bytes
+from cache import LRUCache
 from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import sqlite3
 
-import hashlib
+import hashing
 
 # need 16-bit radix 
 # create tree with values 
@@ -12,147 +18,567 @@ import hashlib
 class Block: 
     state_root: any
 
+DIGEST_SIZE = hashing.DIGEST_SIZE
+
+# every db record (node or account) is stored under the hash of its bytes
+def record_digest(data) -> bytes: 
+    return hashing.hash(data)
+
+# packed key (see radix16.pack_key) <=> record bytes
+# hex keys are nibble-packed bytes (first byte 0 or 1), other keys are 
+# stored as utf-8 behind a 2 and the root's None key is empty
+def encode_key(packed) -> bytes: 
+    if packed is None: 
+        return b''
+    if type(packed) is str: 
+        return b'\x02' + packed.encode('utf-8')
+    n = (packed.bit_length() - 1) // 4 # nibbles behind the 1
+    odd = n & 1
+    nibbles = packed ^ 1 << 4 * n
+    return bytes((odd,)) + (nibbles << 4 * odd).to_bytes((n + 1) // 2, 'big')
+
+def decode_key(data: memoryview): 
+    if len(data) == 0: 
+        return None
+    if data[0] == 2: 
+        return str(data[1:], 'utf-8')
+    odd = data[0]
+    n = 2 * (len(data) - 1) - odd
+    return int.from_bytes(data[1:], 'big') >> 4 * odd | 1 << 4 * n
+
 # extend radix node for merkle things
 class MerkleNode(Node): 
+    __slots__ = ('digest', 'dirty')
 
     @staticmethod
     def default(): 
-        return MerkleNode(None, None, [None] * 16)
+        node = MerkleNode.__new__(MerkleNode)
+        node._key = node._rest = None
+        node.digest = None # cached digest from the last commit
+        node.dirty = True # True if the node changed since its last commit
+        return node
 
+    def touch(self): 
+        self.dirty = True
+
+    # node record: 
+    #   key (length-prefixed) + value (length-prefixed, empty for None) 
+    #   + 16-bit children bitmap + the raw digest of each child which exists
+    # the position of each child is part of the record (and so the digest) 
+    # so a proof cant move it around
+    # (all the children need to be committed first)
+    def serialize(self) -> bytes: 
+        out = bytearray()
+        write_bytes(out, encode_key(self._key))
+        write_bytes(out, self.value or b'')
+        out += self.bitmap.to_bytes(2, 'little')
+        for child in self.kids or (): 
+            out += child.digest
+        return bytes(out)
+
+    # the value + child digests are memoryview slices into `data` (no copies)
     @staticmethod
     def deserialize(data):
+        buf = memoryview(data)
+        key, offset = read_bytes(buf, 0)
+        value, offset = read_bytes(buf, offset)
+        bitmap = int.from_bytes(buf[offset:offset + 2], 'little')
+        offset += 2
+
         node = MerkleNode.default()
-        node.children = data['children']
-        node.key = data['key']
-        node.value = data['value']
+        node._key = decode_key(key)
+        node._set(bitmap, value if len(value) else None, tuple(
+            buf[i:i + DIGEST_SIZE] 
+            for i in range(offset, offset + bitmap.bit_count() * DIGEST_SIZE, DIGEST_SIZE)
+        ))
         return node
 
     # traverse tree and insert all accounts in a database
+    # only dirty nodes (the path of each insert since the last commit) are 
+    # re-hashed and re-written, clean subtrees return their cached digest
     def commit(self, db): 
-        m = hashlib.sha256()
-        serialized = {}
-
-        if self.key:
-            m.update(bytes(self.key, 'utf-8'))
-        serialized['key'] = self.key
-
-        if self.value:
-            m.update(bytes(self.value, 'utf-8'))
-        serialized['value'] = self.value
-
-        child_digests = []
-        for child in self.children: 
-            child: MerkleNode
-            if child: 
-                child_digest = child.commit(db) # recursive call
-                m.update(bytes.fromhex(child_digest))
-                child_digests.append(child_digest)
-
-        serialized['children'] = child_digests
-
-        ## in prod would store the bytes (not the obj directly)
-        # serialized = bytes(json.dumps(serialized), 'utf-8')
-
-        digest = m.hexdigest()[:16]
-        db[digest] = serialized
-
-        return digest
+        if not self.dirty: 
+            return self.digest
+
+        # group the dirty nodes by depth
+        levels = []
+        stack = [(self, 0)]
+        while stack: 
+            node, depth = stack.pop()
+            if depth == len(levels): 
+                levels.append([])
+            levels[depth].append(node)
+            for child in node.kids or (): 
+                if child.dirty: 
+                    stack.append((child, depth + 1))
+
+        # bottom-up: once the deeper levels are committed all the child 
+        # digests of a level are known, so the level is hashed in one batch
+        for nodes in reversed(levels): 
+            records = [node.serialize() for node in nodes]
+            digests = hashing.hash_many(records)
+            # one batched write per level (db: a dict or any mapping with update)
+            db.update(zip(digests, records))
+            for node, digest in zip(nodes, digests): 
+                node.digest = digest
+                node.dirty = False
+
+        return self.digest
+
+    # same as commit but the dirty top-level subtrees are committed in a 
+    # process pool, then the root is hashed => same root as commit
+    # open_db: called in each worker, returns a mapping onto the same storage 
+    # as db (eg, the on-disk db re-opened) which the worker commits its 
+    # subtree straight to, so only its digests come back (one bytes object)
+    # without it (eg, an in-memory dict the workers cant share) the records 
+    # come back too + are written with one db.update per subtree
+    # the parent then sets the subtree's digests in one walk (its copy of the 
+    # tree is committed too: an insert only re-hashes its own path after)
+    def commit_parallel(self, db, workers=None, open_db=None): 
+        if not self.dirty: 
+            return self.digest
+
+        global _COMMIT_ROOT, _COMMIT_OPEN_DB
+        subtrees = [i for i, child in enumerate(self.kids or ()) if child.dirty]
+
+        # forked workers see the tree as it is when the pool starts 
+        # (nothing is pickled on the way in)
+        _COMMIT_ROOT, _COMMIT_OPEN_DB = self, open_db
+        try: 
+            ctx = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(workers, mp_context=ctx) as pool: 
+                kids = self.kids
+                for i, (digests, records) in zip(subtrees, pool.map(_commit_subtree, subtrees)): 
+                    if records is not None: 
+                        db.update(zip(split_digests(digests), records))
+                    set_digests(kids[i], digests)
+        finally: 
+            _COMMIT_ROOT = _COMMIT_OPEN_DB = None
+
+        return self.commit(db) # only the root is left
+
+    # inclusion/exclusion proof for addresses against the last committed root
+    def prove(self, addresses, db): 
+        assert not self.dirty, 'commit the tree before proving'
+        return prove(addresses, self.digest, db)
+
+# dirty nodes of a subtree in a fixed (pre-)order
+def dirty_nodes(node: MerkleNode) -> list: 
+    nodes = []
+    stack = [node]
+    while stack: 
+        node = stack.pop()
+        if node.dirty: 
+            nodes.append(node)
+            stack.extend(node.kids or ())
+    return nodes
+
+def split_digests(digests: bytes) -> list: 
+    return [digests[i:i + DIGEST_SIZE] for i in range(0, len(digests), DIGEST_SIZE)]
+
+# marks a subtree committed with the digests of its dirty nodes (concatenated, in dirty_nodes order)
+def set_digests(node: MerkleNode, digests: bytes): 
+    offset = 0
+    stack = [node]
+    while stack: 
+        node = stack.pop()
+        if node.dirty: 
+            node.digest = digests[offset:offset + DIGEST_SIZE]
+            node.dirty = False
+            offset += DIGEST_SIZE
+            stack.extend(node.kids or ())
+
+# digest => record table in a sqlite file (a db commit_parallel's workers can 
+# each open: sqlite serializes their writes)
+class SqliteNodes: 
+    def __init__(self, path): 
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS nodes (digest BLOB PRIMARY KEY, record BLOB NOT NULL) WITHOUT ROWID')
+
+    def __getitem__(self, digest): 
+        row = self.conn.execute('SELECT record FROM nodes WHERE digest = ?', (digest,)).fetchone()
+        if row is None: 
+            raise KeyError(digest)
+        return row[0]
+
+    def update(self, items): 
+        items = items.items() if hasattr(items, 'items') else items
+        with self.conn: # one transaction
+            self.conn.executemany('INSERT OR REPLACE INTO nodes VALUES (?, ?)', items)
+
+    def items(self): 
+        return self.conn.execute('SELECT digest, record FROM nodes')
+
+_COMMIT_ROOT = None
+_COMMIT_OPEN_DB = None
+
+# (runs in a worker) commits one of the root's subtrees
+# returns the digests of its dirty nodes (concatenated, in dirty_nodes order) 
+# + their records (None if they were written to _COMMIT_OPEN_DB())
+def _commit_subtree(i): 
+    node = _COMMIT_ROOT.kids[i]
+    nodes = dirty_nodes(node)
+    if _COMMIT_OPEN_DB is not None: 
+        node.commit(_COMMIT_OPEN_DB())
+        return b''.join(node.digest for node in nodes), None
+    records = {}
+    node.commit(records)
+    return b''.join(node.digest for node in nodes), [records[node.digest] for node in nodes]
 
 # init the tree
 TREE = MerkleNode.default()
 
+# set to a callable (eg, `print`) to trace lookups
+DEBUG = None
+
 def insert(key: str, value: any):
     print(f'COMMAND: insert({key}, {value})')
     _insert(TREE, key, value)
     print('')
 
-db = {} # manage accounts 
-
-account = Account(100, 'ball')
-digest = account.digest16()
-insert(account.address, digest)
-db[digest] = account.serialize()
-
-account = Account(20, 'abc')
-digest = account.digest16()
-insert(account.address, digest)
-db[digest] = account.serialize()
-
-account = Account(22, 'abcde')
-digest = account.digest16()
-insert(account.address, digest)
-db[digest] = account.serialize()
-
-state_root = TREE.commit(db)
-block0 = Block(state_root)
-
-print(block0)
-TREE.print()
-# print(db)
-
-def get_account(address, state_root, db): 
-    node = MerkleNode.deserialize(db[state_root]) # lookup state / tree root
+def load_node(digest, db, cache: LRUCache = None) -> MerkleNode: 
+    if cache is None: 
+        return MerkleNode.deserialize(db[digest])
+    return cache.get(digest, lambda digest: MerkleNode.deserialize(db[digest]))
 
-    # helper fcn iterating over children
-    def search_children(node, address):
-        for digest in node.children: 
-            child = MerkleNode.deserialize(db[digest])
+def get_account(address, state_root, db, cache: LRUCache = None): 
+    node = load_node(state_root, db, cache) # lookup state / tree root
 
-            if child.key == address: 
-                return child, address, True # search is done
-
-            if child.key in address: 
-                address = address[len(child.key):]
-                return child, address, False # continue search
-
-        return None # dne
-
-    # parse the tree for the address 
+    # parse the tree for the address: one db read per level
     steps = 0
-    while 1:
-        result = search_children(node, address)
-        steps += 1
-        if result is None: # dne
-            return None 
-
-        (node, address, is_done) = result
-
-        if is_done: 
-            print(f"INFO: found account in {steps} steps...")
-            account = Account.deserialize(db[node.value])
-            return account
-
-# account = get_account('abc', state_root, db)
-account = get_account('abcde', state_root, db)
-assert account.address == 'abcde'
-assert account.amount == 22
-print(account)
-
-print("state0 size:", len(db))
-
-# new block
-account = Account(25, 'abcde')
-digest = account.digest16()
-insert(account.address, digest)
-db[digest] = account.serialize()
-
-# OPTIM: can optimize the commit process to only commit the log(N) updates on insert
-state_root = TREE.commit(db) 
-block1 = Block(state_root)
-
-# db size goes from 7 => 11 
-# need 1) new state_root 2) new child digest ('abc') 3) new account digest ('abcdef')
-print("state1 size:", len(db)) 
-
-# new data
-account = get_account('abcde', block1.state_root, db)
-assert account.address == 'abcde'
-assert account.amount == 25
-
-# rollback from different state root (fork data)
-account = get_account('abcde', block0.state_root, db)
-assert account.address == 'abcde'
-assert account.amount == 22
+    while address: 
+        i = HEX_VALUES.find(address[0])
+        if i < 0: 
+            return None # not a hex address
 
+        digest = node.children[i]
+        if digest is None: # dne
+            return None 
 
-print('----')
\ No newline at end of file
+        node = load_node(digest, db, cache)
+        steps += 1
+        if not address.startswith(node.key): # dne
+            return None
+        address = address[len(node.key):]
+
+    if node.value is None: # dne (only a prefix of other addresses)
+        return None
+
+    if DEBUG: DEBUG(f"INFO: found account in {steps} steps...")
+    account = Account.deserialize(db[node.value])
+    return account
+
+## scans 
+# lazily yields (address, account) for the accounts of a committed state in 
+# address order (streams the state: one node per level + the account are in 
+# memory at a time). live trees use radix16's _iter_prefix/_iter_range
+def iter_range(state_root, db, start=None, end=None, prefix='', cache: LRUCache = None): 
+    root = load_node(state_root, db, cache)
+    children = lambda node: (load_node(digest, db, cache) for digest in node.kids or ())
+    for address, digest in walk(root, children, start, end, prefix): 
+        yield address, Account.deserialize(db[digest])
+
+def iter_prefix(state_root, db, prefix, cache: LRUCache = None): 
+    return iter_range(state_root, db, prefix=prefix, cache=cache)
+
+## diffs 
+# co-walks two committed states in address (pre-)order. nodes at the same 
+# absolute path with the same digest are the same subtree, so it is skipped 
+# on both sides without being loaded: the cost is O(changes * depth) node 
+# loads instead of the size of the states 
+
+# pre-order cursor over a committed tree which skips the (parent path, digest)s in `skip`
+class DiffCursor: 
+    def __init__(self, state_root, db, skip, cache: LRUCache = None): 
+        self.db = db
+        self.cache = cache
+        self.skip = skip
+        self.stack = [('', iter((state_root,)))] # (path of the parent, its kids)
+        self.path = self.node = self.digest = None
+        self.next()
+
+    # moves to the next node (descend=False skips the current node's subtree)
+    def next(self, descend=True): 
+        if descend and self.node is not None and self.node.kids: 
+            self.stack.append((self.path, iter(self.node.kids)))
+        while self.stack: 
+            parent_path, kids = self.stack[-1]
+            digest = next(kids, None)
+            if digest is None: 
+                self.stack.pop()
+                continue
+            digest = bytes(digest)
+            if (parent_path, digest) in self.skip: 
+                continue
+            self.node = load_node(digest, self.db, self.cache)
+            self.digest = digest
+            self.path = parent_path + (self.node.key or '')
+            return
+        self.path = self.node = self.digest = None
+
+# lazily yields (kind, address, old account, new account) for kind in 
+# 'added', 'removed', 'modified' from state_root_a to state_root_b in address order
+def diff(state_root_a, state_root_b, db, cache: LRUCache = None): 
+    if state_root_a == state_root_b: 
+        return
+    skip = set()
+    a = DiffCursor(state_root_a, db, skip, cache)
+    b = DiffCursor(state_root_b, db, skip, cache)
+    account = lambda digest: Account.deserialize(db[digest])
+
+    while a.node is not None or b.node is not None: 
+        if b.node is None or a.node is not None and a.path < b.path: 
+            # only in a
+            if a.node.value is not None: 
+                yield 'removed', a.path, account(a.node.value), None
+            a.next()
+        elif a.node is None or b.path < a.path: 
+            # only in b
+            if b.node.value is not None: 
+                yield 'added', b.path, None, account(b.node.value)
+            b.next()
+        elif a.digest == b.digest: 
+            # same subtree
+            a.next(descend=False)
+            b.next(descend=False)
+        else: 
+            value_a, value_b = a.node.value, b.node.value
+            if value_a is None and value_b is not None: 
+                yield 'added', b.path, None, account(value_b)
+            elif value_a is not None and value_b is None: 
+                yield 'removed', a.path, account(value_a), None
+            elif value_a is not None and bytes(value_a) != bytes(value_b): 
+                yield 'modified', a.path, account(value_a), account(value_b)
+
+            # kids in the same slot with the same digest are the same subtree
+            for i in range(16): 
+                kid = a.node.get_child(i)
+                if kid is not None and kid == b.node.get_child(i): 
+                    skip.add((a.path, bytes(kid)))
+            a.next()
+            b.next()
+
+## proofs 
+# a proof is the set of db records a lookup reads: the node on each level of 
+# the path (its key, value + the digests of its siblings' subtrees) and the 
+# account itself. verifying = re-running the lookup on the proof records 
+# while checking each record hashes to the digest its parent points to. 
+# exclusion proofs are the same, the lookup just ends without an account.
+
+# db wrapper which records every read
+class ProofRecorder: 
+    def __init__(self, db): 
+        self.db = db
+        self.records = {}
+
+    def __getitem__(self, digest): 
+        data = self.db[digest]
+        self.records[digest] = data
+        return data
+
+# proof records => db which only serves records that match their digest
+# (each digest is hashed once, so paths shared across proofs are verified once)
+class ProofDB: 
+    def __init__(self, records): 
+        self.records = records
+        self.verified = set()
+
+    def __getitem__(self, digest): 
+        data = self.records.get(digest)
+        if data is None: 
+            raise ValueError(f'invalid proof: missing record {digest}')
+
+        if digest not in self.verified: 
+            if record_digest(data) != digest: 
+                raise ValueError(f'invalid proof: bad record {digest}')
+            self.verified.add(digest)
+        return data
+
+# one proof for all the addresses (nodes shared between paths are included once)
+def prove(addresses, state_root, db) -> dict: 
+    recorder = ProofRecorder(db)
+    for address in addresses: 
+        get_account(address, state_root, recorder)
+    return recorder.records
+
+# returns {address: account (or None if it doesnt exist)}, raises ValueError on a bad proof
+def verify_proofs(proof, state_root, addresses) -> dict: 
+    db = ProofDB(proof)
+    return {address: get_account(address, state_root, db) for address in addresses}
+
+## pruning 
+# mark-and-sweep: a state (root) keeps every record reachable from it, the 
+# records only older states point to can be deleted (eg, keep the last N 
+# block state roots + any pinned roots)
+
+# digests of the records reachable from the roots (nodes + accounts)
+def reachable(roots, db) -> set: 
+    live = set()
+    stack = [bytes(root) for root in roots]
+    while stack: 
+        digest = stack.pop()
+        if digest in live: # shared subtree
+            continue
+        live.add(digest)
+        node = MerkleNode.deserialize(db[digest])
+        if node.value is not None: 
+            live.add(bytes(node.value))
+        stack.extend(bytes(kid) for kid in node.kids or ())
+    return live
+
+# deletes every record which isnt reachable from the roots, returns the number deleted
+def prune(db, roots) -> int: 
+    live = reachable(roots, db)
+    dead = [digest for digest in db if digest not in live]
+    for digest in dead: 
+        del db[digest]
+    return len(dead)
+
+if __name__ == "__main__":
+    DEBUG = print
+
+    db = {} # manage accounts 
+
+    account = Account(100, 'ball')
+    digest = account.digest()
+    insert(account.address, digest)
+    db[digest] = account.serialize()
+
+    account = Account(20, 'abc')
+    digest = account.digest()
+    insert(account.address, digest)
+    db[digest] = account.serialize()
+
+    account = Account(22, 'abcde')
+    digest = account.digest()
+    insert(account.address, digest)
+    db[digest] = account.serialize()
+
+    state_root = TREE.commit(db)
+    block0 = Block(state_root)
+
+    print(block0)
+    TREE.print()
+    # print(db)
+
+    # account = get_account('abc', state_root, db)
+    account = get_account('abcde', state_root, db)
+    assert account.address == 'abcde'
+    assert account.amount == 22
+    print(account)
+
+    print("state0 size:", len(db))
+
+    # new block
+    account = Account(25, 'abcde')
+    digest = account.digest()
+    insert(account.address, digest)
+    db[digest] = account.serialize()
+
+    # only the log(N) nodes on the updated path are re-hashed (see MerkleNode.commit)
+    state_root = TREE.commit(db) 
+    block1 = Block(state_root)
+
+    # db size goes from 7 => 11 
+    # need 1) new state_root 2) new child digest ('abc') 3) new account digest ('abcdef')
+    print("state1 size:", len(db)) 
+    assert len(db) == 11
+
+    # nothing changed since the last commit => cached root
+    assert TREE.commit(db) == block1.state_root
+
+    # incremental commit == full commit of the same accounts 
+    tree = MerkleNode.default()
+    for address, amount in [('ball', 100), ('abc', 20), ('abcde', 25)]: 
+        _insert(tree, address, Account(amount, address).digest())
+    assert tree.commit({}) == block1.state_root
+
+    # parallel commit == serial commit
+    tree = MerkleNode.default()
+    for address, amount in [('ball', 100), ('abc', 20), ('abcde', 25)]: 
+        _insert(tree, address, Account(amount, address).digest())
+    assert tree.commit_parallel({}, workers=2) == block1.state_root
+
+    # commit_parallel leaves every node committed (an insert after only re-hashes its path)
+    import random
+    rng = random.Random(0)
+    keys = [f'{rng.getrandbits(64):016x}' for _ in range(300)]
+    serial, parallel = MerkleNode.default(), MerkleNode.default()
+    for tree in (serial, parallel): 
+        for key in keys[:200]: 
+            _insert(tree, key, key.encode())
+    serial_db, parallel_db = {}, {}
+    assert parallel.commit_parallel(parallel_db, workers=2) == serial.commit(serial_db)
+    assert parallel_db == serial_db
+    for key in keys[200:]: 
+        for tree in (serial, parallel): 
+            _insert(tree, key, key.encode())
+        assert parallel.commit(parallel_db) == serial.commit(serial_db)
+    assert parallel_db == serial_db
+    assert not dirty_nodes(parallel)
+
+    # workers writing straight to a shared db (each opens the same sqlite file)
+    import tempfile, os
+    with tempfile.TemporaryDirectory() as tmp: 
+        path = os.path.join(tmp, 'nodes.sqlite')
+        tree = MerkleNode.default()
+        for key in keys: 
+            _insert(tree, key, key.encode())
+        shared = SqliteNodes(path)
+        shared_root = tree.commit_parallel(shared, workers=2, open_db=lambda: SqliteNodes(path))
+        assert shared_root == serial.commit(serial_db)
+        live = reachable([shared_root], serial_db) & serial_db.keys() # (minus the values)
+        assert dict(shared.items()) == {digest: serial_db[digest] for digest in live}
+
+    # new data
+    account = get_account('abcde', block1.state_root, db)
+    assert account.address == 'abcde'
+    assert account.amount == 25
+
+    # rollback from different state root (fork data)
+    account = get_account('abcde', block0.state_root, db)
+    assert account.address == 'abcde'
+    assert account.amount == 22
+
+
+    print('----')
+
+    # repeated lookups read the upper nodes from the cache
+    cache = LRUCache(max_size=16)
+    for _ in range(3): 
+        account = get_account('abcde', block1.state_root, db, cache)
+        assert account.amount == 25
+    assert (cache.hits, cache.misses) == (6, 3)
+
+    # proofs for one account + one which doesnt exist, without the db
+    proof = TREE.prove(['abcde', 'abcd'], db)
+    accounts = verify_proofs(proof, block1.state_root, ['abcde', 'abcd'])
+    assert accounts['abcde'].amount == 25
+    assert accounts['abcd'] == None
+    print("proof size:", len(proof))
+
+    # ordered scans over the committed states
+    accounts = [(address, account.amount) for address, account in iter_range(block1.state_root, db)]
+    assert accounts == [('abc', 20), ('abcde', 25), ('ball', 100)]
+    accounts = [(address, account.amount) for address, account in iter_prefix(block0.state_root, db, 'abcd')]
+    assert accounts == [('abcde', 22)]
+    assert [address for address, _ in iter_range(block1.state_root, db, 'abcd', 'b')] == ['abcde']
+
+    # block0 => block1 only changed 'abcde'
+    changes = [(kind, address, old and old.amount, new and new.amount) 
+        for kind, address, old, new in diff(block0.state_root, block1.state_root, db)]
+    assert changes == [('modified', 'abcde', 22, 25)]
+
+    # only keep block1's state: block0's root, 'abc' + 'de' nodes and account are deleted
+    assert prune(db, [block1.state_root]) == 4
+    assert len(db) == 7
+    assert get_account('abcde', block1.state_root, db).amount == 25
+    assert get_account('ball', block1.state_root, db).amount == 100
+
+    # tampered account data => invalid proof
+    proof[_lookup(TREE, 'abcde')] = Account(1000, 'abcde').serialize()
+    try: 
+        verify_proofs(proof, block1.state_root, ['abcde'])
+        assert False
+    except ValueError: 
+        pass
@@ -1,6 +1,8 @@
 # radix tree which builds a tree of chars
 from dataclasses import dataclass
 
+from walk import walk
+
 @dataclass
 class Node: 
     key: str
@@ -10,85 +12,96 @@ class Node:
 
 TREE = Node(None, None, [], None)
 
+# set to a callable (eg, `print`) to trace what _insert/_lookup are doing
+DEBUG = None
+
 def insert(key: str, value: any):
     print(f'COMMAND: insert({key}, {value})')
     _insert(TREE, key, value)
     print('')
 
 def common_substring(s1, s2): 
-    for i in range(min(len(s1), len(s2))): 
+    n = min(len(s1), len(s2))
+    for i in range(n): 
         if s1[i] != s2[i]: 
             return i
+    return n
 
+# iterative so keys of any length dont hit the recursion limit
 def _insert(node: Node, key: str, value: any):
-    # handles initial inserts '1'
-    if node.key == None: 
-        node.key = key
-        node.value = value
-        print(f'setting node value ({node.key}, {node.value})')
-        return 
-    
-    # handles updates (insert '2')
-    if node.key == key: 
-        print(f'updating node value (k {node.key}): {node.value} -> {value}')
-        node.value = value
-        return # end
-
-    # handles adding a child or parent
-    # ensure its a sub or super string
-    key_is_sub_string = key in node.key 
-    key_is_super_string = node.key in key
-
-    # common_count = common_substring(key, node.key)
-    # contains_common = common_count > 0
-
-    assert key_is_sub_string or key_is_super_string # or contains_common
-    
-    # either 
-    #   insert '123' in '12'
-    #   check if '3' is substring of another node
-    if key_is_super_string: 
-        child_chars = key[len(node.key):]
+    while True: 
+        # handles initial inserts '1'
+        if node.key == None: 
+            node.key = key
+            node.value = value
+            if DEBUG: DEBUG(f'setting node value ({node.key}, {node.value})')
+            return 
+        
+        # handles updates (insert '2')
+        if node.key == key: 
+            if DEBUG: DEBUG(f'updating node value (k {node.key}): {node.value} -> {value}')
+            node.value = value
+            return # end
 
-        # grow tree downwards from here 
-        child_dne = True
-        for child_node in node.children: 
-            if child_chars in child_node.key or child_node.key in child_chars: 
-                child_dne = False
-                break 
+        # handles adding a child or parent
+        # ensure its a sub or super string
+        key_is_sub_string = key in node.key 
+        key_is_super_string = node.key in key
+
+        # common_count = common_substring(key, node.key)
+        # contains_common = common_count > 0
+
+        assert key_is_sub_string or key_is_super_string # or contains_common
         
-        if child_dne: 
-            print(f'creating new child for {node.key}: ({child_chars})')
-            new_node = Node(child_chars, value, [], node)
-            node.children.append(new_node)
-        else: 
-            _insert(child_node, child_chars, value)
-
-    elif key_is_sub_string: 
-        # OR
-        #   insert '3' (key) in '34' (node.key) THEN
-            # parent => node  
-            # changes to: parent => new_node('3') => node('4')
-        print(f"{key} is substring of {node.key}")
-
-        parent: Node = node.parent 
-        # update parent
-        child_index = [True if child.key == node.key else False for child in node.parent.children].index(True)
-        del parent.children[child_index]
-
-        # update current node
-        new_node = Node(key, value, [node], node.parent)
-        node.parent = new_node
-        node.key = node.key[len(key):]
-
-        # update parent
-        parent.children.append(new_node)
-    
-    # elif contains_common: 
-    #     # insert e3344 when root = e3311
-    #     # e33 => [44, 11]
+        # either 
+        #   insert '123' in '12'
+        #   check if '3' is substring of another node
+        if key_is_super_string: 
+            child_chars = key[len(node.key):]
+
+            # grow tree downwards from here 
+            child_dne = True
+            for child_node in node.children: 
+                if child_chars in child_node.key or child_node.key in child_chars: 
+                    child_dne = False
+                    break 
+            
+            if child_dne: 
+                if DEBUG: DEBUG(f'creating new child for {node.key}: ({child_chars})')
+                new_node = Node(child_chars, value, [], node)
+                node.children.append(new_node)
+            else: 
+                node, key = child_node, child_chars
+                continue
+
+        elif key_is_sub_string: 
+            # OR
+            #   insert '3' (key) in '34' (node.key) THEN
+                # parent => node  
+                # changes to: parent => new_node('3') => node('4')
+            if DEBUG: DEBUG(f"{key} is substring of {node.key}")
+
+            parent: Node = node.parent 
+            # update parent
+            child_index = [True if child.key == node.key else False for child in node.parent.children].index(True)
+            del parent.children[child_index]
+
+            # update current node
+            new_node = Node(key, value, [node], node.parent)
+            node.parent = new_node
+            node.key = node.key[len(key):]
+
+            # update parent
+            parent.children.append(new_node)
+        
+        # elif contains_common: 
+        #     # insert e3344 when root = e3311
+        #     # e33 => [44, 11]
+        return
 
 if __name__ == "__main__":
+    DEBUG = print
+
     insert('12', 1)
     assert(TREE.key == '12')
     assert(TREE.value == 1)
@@ -122,34 +135,57 @@ def lookup(key: str) -> any:
     return result
 
 def _lookup(node: Node, key: str) -> any:
-    if node.key == key: 
-        print(f'found: {key, node.value}')
-        return node.value
-
-    # handles adding a child or parent
-    # ensure its a sub or super string
-    # lookup '123' in tree: '12' -> '3' -- node.key is substring
-    key_is_super_string = node.key in key
-    assert key_is_super_string
-
-    child_chars = key[len(node.key):]
-    print(f'traversing for {child_chars}...')
-
-    # grow tree downwards from here 
-    child_dne = True
-    for child_node in node.children: 
-        if child_node.key in child_chars: 
-            child_dne = False
-            break 
-
-    if child_dne: 
-        return None
-    else: 
-        return _lookup(child_node, child_chars)
+    while True: 
+        if node.key == key: 
+            if DEBUG: DEBUG(f'found: {key, node.value}')
+            return node.value
+
+        # handles adding a child or parent
+        # ensure its a sub or super string
+        # lookup '123' in tree: '12' -> '3' -- node.key is substring
+        key_is_super_string = node.key in key
+        assert key_is_super_string
+
+        child_chars = key[len(node.key):]
+        if DEBUG: DEBUG(f'traversing for {child_chars}...')
+
+        # grow tree downwards from here 
+        child_dne = True
+        for child_node in node.children: 
+            if child_node.key in child_chars: 
+                child_dne = False
+                break 
+
+        if child_dne: 
+            return None
+        else: 
+            node, key = child_node, child_chars
+
+# children are kept in insert order
+def _children(node: Node): 
+    return sorted(node.children, key=lambda child: child.key)
+
+def _iter_prefix(node: Node, prefix: str): 
+    return walk(node, _children, prefix=prefix)
+
+def _iter_range(node: Node, start: str = None, end: str = None): 
+    return walk(node, _children, start, end)
 
 if __name__ == "__main__":
     assert lookup("12") == 1
     assert lookup("1234") == 1
     assert lookup("123") == 21
 
+    # ordered prefix/range scans
+    assert list(_iter_range(TREE)) == [('12', 1), ('123', 21), ('1234', 1), ('12abc', 24)]
+    assert list(_iter_prefix(TREE, '123')) == [('123', 21), ('1234', 1)]
+    assert list(_iter_range(TREE, '1230', '12b')) == [('1234', 1), ('12abc', 24)]
+
+    # deep keys dont hit the recursion limit
+    DEBUG = None
+    for i in range(3, 3000): 
+        _insert(TREE, '12' + 'a' * i, i)
+    assert _lookup(TREE, '12' + 'a' * 2999) == 2999
+    assert sum(1 for _ in _iter_prefix(TREE, '12aa')) == 2997
+
     print('success')
\ No newline at end of file
@@ -1,22 +1,208 @@
 # radix tree for hex values
 
-from dataclasses import dataclass
 import hashlib
+import gc
 
-@dataclass
+from walk import walk
+
+HEX_VALUES = '0123456789abcdef'
+
+# hex keys are stored as an int behind a 1 nibble: 'abc' => 0x1abc 
+# (the 1 keeps leading zeros), 1 nibble keys (most of the branches) are 
+# small ints which python shares so they cost nothing
+# non-hex keys (eg, 'ball' in the patricia demo) are stored as-is
+def pack_key(key: str): 
+    if not key or key.strip(HEX_VALUES): 
+        return key
+    return int('1' + key, 16)
+
+def unpack_key(packed) -> str: 
+    if packed is None or type(packed) is str: 
+        return packed
+    return hex(packed)[3:]
+
+# a branch's (bitmap low byte, bitmap high byte, *children)
+# (bytes are shared small ints, so the bitmap costs no int of its own)
+class _Kids(tuple): 
+    __slots__ = ()
+
+# a branch which has a value too: (bitmap low byte, bitmap high byte, value, *children)
+class _ValueKids(tuple): 
+    __slots__ = ()
+
+# compact node layout: instead of a list of 16 mostly-None children we keep 
+# a 16-bit occupancy bitmap + a dense tuple of the children which exist, 
+# ie, child i is at kids[popcount(bitmap below i)]
+# a node has 2 slots: the packed key + `_rest`, which is the value itself for 
+# a leaf (no bitmap, no tuple) and a _Kids/_ValueKids tuple for a branch
 class Node: 
-    key: str
-    value: any 
-    children: list[any] # list[Node]
+    __slots__ = ('_key', '_rest')
 
+    def __init__(self, key: str, value: any, children: list[any]):
+        self.key = key
+        self._rest = value
+        self.children = children
+
+    # an empty node (no key, value or children)
     @staticmethod
     def default(): 
-        return Node(None, None, [None] * 16)
+        node = Node.__new__(Node)
+        node._key = node._rest = None
+        return node
+
+    @property
+    def key(self) -> str: 
+        return unpack_key(self._key)
+
+    @key.setter
+    def key(self, key: str): 
+        self._key = pack_key(key)
+
+    @property
+    def value(self): 
+        rest = self._rest
+        kind = type(rest)
+        if kind is _Kids: 
+            return None
+        return rest[2] if kind is _ValueKids else rest
+
+    @value.setter
+    def value(self, value): 
+        kind = type(self._rest)
+        if kind is _Kids or kind is _ValueKids: 
+            bitmap, _, kids = self._unpack()
+            self._set(bitmap, value, kids)
+        else: 
+            self._rest = value # a leaf
+
+    @property
+    def bitmap(self) -> int: 
+        return self._unpack()[0]
+
+    @bitmap.setter
+    def bitmap(self, bitmap: int): 
+        _, value, kids = self._unpack()
+        self._set(bitmap, value, kids)
+
+    # the children which exist, in nibble order (None for a leaf)
+    @property
+    def kids(self) -> tuple: 
+        return self._unpack()[2] or None
+
+    @kids.setter
+    def kids(self, kids: tuple): 
+        bitmap, value, _ = self._unpack()
+        self._set(bitmap, value, tuple(kids or ()))
+
+    # sets all the children at once: the children in nibble order + their bitmap
+    def set_kids(self, bitmap: int, kids): 
+        self._set(bitmap, self.value, tuple(kids))
+
+    # _rest => (bitmap, value, kids)
+    def _unpack(self): 
+        rest = self._rest
+        kind = type(rest)
+        if kind is _Kids: 
+            return rest[0] | rest[1] << 8, None, rest[2:]
+        if kind is _ValueKids: 
+            return rest[0] | rest[1] << 8, rest[2], rest[3:]
+        return 0, rest, ()
+
+    def _set(self, bitmap: int, value, kids: tuple): 
+        if not bitmap and not kids: 
+            self._rest = value
+        elif value is None: 
+            self._rest = _Kids((bitmap & 0xff, bitmap >> 8) + kids)
+        else: 
+            self._rest = _ValueKids((bitmap & 0xff, bitmap >> 8, value) + kids)
+
+    @property
+    def children(self) -> 'Children': 
+        return Children(self)
+
+    @children.setter
+    def children(self, children: list[any]): 
+        self._set(0, self.value, ())
+        for i, child in enumerate(children): 
+            if child is not None: 
+                self.set_child(i, child)
+
+    def get_child(self, i: int): 
+        rest = self._rest
+        kind = type(rest)
+        if kind is _Kids: 
+            first = 2
+        elif kind is _ValueKids: 
+            first = 3
+        else: 
+            return None
+        bitmap = rest[0] | rest[1] << 8
+        bit = 1 << i
+        if not bitmap & bit: 
+            return None
+        return rest[first + (bitmap & (bit - 1)).bit_count()]
+
+    def set_child(self, i: int, child): 
+        bitmap, value, kids = self._unpack()
+        bit = 1 << i
+        index = (bitmap & (bit - 1)).bit_count()
+        if bitmap & bit: 
+            if child is None: 
+                bitmap ^= bit
+                kids = kids[:index] + kids[index + 1:]
+            else: 
+                kids = kids[:index] + (child,) + kids[index + 1:]
+        elif child is not None: 
+            bitmap |= bit
+            kids = kids[:index] + (child,) + kids[index:]
+        else: 
+            return
+        self._set(bitmap, value, kids)
+
+    # called on every node an insert passes through or modifies
+    # (no-op here, MerkleNode uses it to track which digests are stale)
+    def touch(self): 
+        pass
 
     def print(self): 
         print_tree(self)
 
-HEX_VALUES = '0123456789abcdef'
+    def __eq__(self, other): 
+        if not isinstance(other, Node): 
+            return NotImplemented
+        return (self._key, self._rest) == (other._key, other._rest)
+
+    def __repr__(self): 
+        return f'{type(self).__name__}(key={self.key!r}, value={self.value!r}, children={list(self.children)!r})'
+
+# 16-slot list view over a node's children so `node.children[i]` works
+class Children: 
+    __slots__ = ('node',)
+
+    def __init__(self, node: Node): 
+        self.node = node
+
+    def __len__(self): 
+        return 16
+
+    def __getitem__(self, i: int): 
+        return self.node.get_child(i)
+
+    def __setitem__(self, i: int, child): 
+        self.node.set_child(i, child)
+
+    def __iter__(self): 
+        bitmap, kids = self.node.bitmap, self.node.kids
+        index = 0
+        for i in range(16): 
+            if bitmap >> i & 1: 
+                yield kids[index]
+                index += 1
+            else: 
+                yield None
+
+    def __eq__(self, other): 
+        return list(self) == list(other)
 
 def print_tree(node: Node, indent: str = ""):
     if node.key == None and node.value == None: 
@@ -35,82 +221,184 @@ def ishex(char):
     return len(char) == 1 and char in HEX_VALUES 
 
 def common_substring(s1, s2): 
-    print(f'comparing: {s1} {s2}')
-    for i in range(min(len(s1), len(s2))): 
+    n = min(len(s1), len(s2))
+    for i in range(n): 
         if s1[i] != s2[i]: 
             return i
-    return i + 1
+    return n
 
+# set to a callable (eg, `print`) to trace what _insert/_lookup are doing
+DEBUG = None
+
+# iterative so keys of any length (eg, 64 nibble hashes) dont hit the recursion limit
 def _insert(node: Node, key: str, value: any):
-    char = key[0]
-    assert ishex(char)
-    v = int(char, 16)
-
-    rest = key[1:]
-
-    # handle initialization
-    # insert 'abc'
-        # tree -> [('abc')]
-    if node.children[v] == None: 
-        print('initializing empty...')
-        leaf_node = node.default()
-        leaf_node.key = key
+    while True: 
+        char = key[0]
+        assert ishex(char)
+        v = int(char, 16)
+        node.touch()
+
+        # handle initialization
+        # insert 'abc'
+            # tree -> [('abc')]
+        child_node = node.get_child(v)
+        if child_node is None: 
+            if DEBUG: DEBUG('initializing empty...')
+            leaf_node = node.default()
+            leaf_node.key = key
+            leaf_node.value = value
+            node.set_child(v, leaf_node)
+            return # exit
+
+        child_key = child_node.key
+        assert child_key[0] == char
+
+        # handle updating value
+        if key == child_key: 
+            if DEBUG: DEBUG(f'updating node value: {child_node.value}->{value}')
+            child_node.value = value 
+            child_node.touch()
+            return 
+
+        substring_len = common_substring(key, child_key)
+        assert substring_len > 0
+
+        if substring_len == len(child_key): 
+            # grow from child 
+            if DEBUG: DEBUG(f'traversing ... {key} => {key[substring_len:]}')
+            node, key = child_node, key[substring_len:]
+            continue
+
+        if substring_len == len(key):
+            # parent -> new_node
+            new_node = node.default()
+            new_node.key = key
+            new_node.value = value
+
+            # new_node -> child_node
+            child_node.key = child_key[substring_len:]
+            child_node.touch()
+            new_node.set_child(int(child_key[substring_len], 16), child_node)
+
+            node.set_child(v, new_node)
+        else: 
+            # parent -> new_tmp_node -> [child_node', new_node']
+
+            # parent -> new_tmp_node
+            common_substring_ = key[:substring_len]
+            if DEBUG: DEBUG(f'setting up common substring: {common_substring_}...')
+            new_tmp_node = node.default()
+            new_tmp_node.key = common_substring_
+            new_tmp_node.value = None
+            node.set_child(v, new_tmp_node)
+
+            # new_tmp_node -> [new_node']
+            new_node = node.default()
+            new_node.key = key[substring_len:]
+            new_node.value = value
+            new_tmp_node.set_child(int(key[substring_len], 16), new_node)
+
+            # new_tmp_node -> [new_node', child_node']
+            child_node.key = child_key[substring_len:]
+            child_node.touch()
+            new_tmp_node.set_child(int(child_key[substring_len], 16), child_node)
+        return
+
+def _lookup(node: Node, key: str) -> any:
+    i = 0 # nibbles of the key matched so far
+    while i < len(key): 
+        child_node = node.get_child(int(key[i], 16))
+        if child_node is None: 
+            return None
+
+        child_key = child_node.key
+        if not key.startswith(child_key, i): 
+            return None
+
+        if DEBUG: DEBUG(f'traversing ... {key[i:]} => {key[i + len(child_key):]}')
+        i += len(child_key)
+        node = child_node
+
+    if DEBUG: DEBUG(f'found: {key, node.value}')
+    return node.value
+
+def _children(node: Node): 
+    return node.kids or ()
+
+def _iter_prefix(node: Node, prefix: str): 
+    return walk(node, _children, prefix=prefix)
+
+def _iter_range(node: Node, start: str = None, end: str = None): 
+    return walk(node, _children, start, end)
+
+# bulk-load: builds the same tree as calling _insert on each key but in a 
+# single pass over (key, value) pairs sorted by key. since keys come in order 
+# only the right-most path of the tree (the `spine`) can still change, so 
+# each key hangs off the spine at its common prefix with the previous key
+def from_sorted(items, default=Node.default) -> Node:
+    # the cyclic gc re-scans every live node each time a batch of new nodes 
+    # is allocated, which dominates the build time for large trees
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try: 
+        return _from_sorted(items, default)
+    finally: 
+        if gc_enabled: 
+            gc.enable()
+
+def _from_sorted(items, default) -> Node:
+    root = default()
+    # [node, key length at the end of the node, its children so far, their bitmap]
+    # a node's children are collected while its on the spine + set once when 
+    # its popped (one children tuple per node, not one per child added)
+    spine = [[root, 0, [], 0]]
+    prev = ''
+
+    for key, value in items: 
+        if key == prev: # duplicate key => last value wins
+            spine[-1][0].value = value
+            continue
+        assert key > prev, 'keys must be sorted'
+
+        prefix_len = 0
+        n = min(len(prev), len(key))
+        while prefix_len < n and prev[prefix_len] == key[prefix_len]: 
+            prefix_len += 1
+
+        # pop the nodes past the common prefix
+        child = None
+        while spine[-1][1] > prefix_len: 
+            child, child_end, kids, bitmap = spine.pop()
+            if kids: 
+                child.set_kids(bitmap, kids)
+        top = spine[-1]
+        end = top[1]
+
+        # the common prefix ends inside `child` => split it 
+        # parent -> child ==> parent -> tmp_node -> child'
+        # (child was the parent's last child, tmp_node takes its nibble)
+        if child is not None and end < prefix_len: 
+            tmp_node = default()
+            tmp_node.key = key[end:prefix_len]
+            top[2][-1] = tmp_node
+
+            child.key = prev[prefix_len:child_end]
+            top = [tmp_node, prefix_len, [child], 1 << int(prev[prefix_len], 16)]
+            spine.append(top)
+
+        leaf_node = default()
+        leaf_node.key = key[prefix_len:]
         leaf_node.value = value
-        node.children[v] = leaf_node
-        return # exit
-
-    child_node = node.children[v]
-    child_key = child_node.key
-    assert child_key[0] == char
-
-    # handle updating value
-    if key == child_key: 
-        print(f'updating node value: {node.value}->{value}')
-        child_node.value = value 
-        return 
-
-    # update value 
-    substring_len = common_substring(key, child_key)
-    assert substring_len > 0
-
-    print(f'traversing ... {key} => {rest}')
-    if substring_len == len(child_key): 
-        rest = key[substring_len:]
-        # grow from child 
-        _insert(child_node, rest, value)
-
-    elif substring_len == len(key):
-        # parent -> new_node
-        new_node = Node.default()
-        new_node.key = key
-        new_node.value = value
-
-        # new_node -> child_node
-        child_node.key = child_key[substring_len:]
-        char = child_node.key[0]
-        new_node.children[int(char, 16)] = child_node
-
-        node.children[v] = new_node
-    else: 
-        # parent -> new_tmp_node -> [child_node', new_node']
-
-        # parent -> new_tmp_node
-        common_substring_ = key[:substring_len]
-        print(f'setting up common substring: {common_substring_}...')
-        new_tmp_node = node.default()
-        new_tmp_node.key = common_substring_
-        new_tmp_node.value = None
-        node.children[v] = new_tmp_node
-
-        # new_tmp_node -> [new_node']
-        new_node = node.default()
-        new_node.key = key[substring_len:]
-        new_node.value = value
-        new_tmp_node.children[int(new_node.key[0], 16)] = new_node
-
-        # new_tmp_node -> [new_node', child_node']
-        child_node.key = child_key[substring_len:]
-        new_tmp_node.children[int(child_node.key[0], 16)] = child_node
+        top[2].append(leaf_node)
+        top[3] |= 1 << int(key[prefix_len], 16)
+        spine.append([leaf_node, len(key), [], 0])
+
+        prev = key
+
+    for node, _, kids, bitmap in reversed(spine): 
+        if kids: 
+            node.set_kids(bitmap, kids)
+    return root
 
 TREE = Node.default()
 def insert(key: str, value: any):
@@ -118,7 +406,13 @@ def insert(key: str, value: any):
     _insert(TREE, key, value)
     print('')
 
+def lookup(key: str) -> any:
+    print(f'COMMAND: lookup {key}...')
+    return _lookup(TREE, key)
+
 if __name__ == "__main__":
+    DEBUG = print
+
     insert('a', 1)
     idx = int('a', 16)
     assert TREE.children[idx].key == 'a'
@@ -136,6 +430,11 @@ if __name__ == "__main__":
     assert TREE.children[idx].key == 'ab'
     assert TREE.children[idx].children[int('c', 16)].key == 'cd'
 
+    assert lookup('ab') == 1
+    assert lookup('abcd') == 1
+    assert lookup('abc') == None
+    assert lookup('b') == None
+
 def generate(length = 5): 
     import random
     out = ''
@@ -150,4 +449,28 @@ if __name__ == "__main__":
         x = generate()
         insert(x, 2)
 
-    print_tree(TREE)
\ No newline at end of file
+    print_tree(TREE)
+
+    # bulk-load builds the same tree as the inserts
+    keys = sorted(set(generate() for _ in range(200)))
+    TREE = Node.default()
+    for x in keys[::-1]: 
+        insert(x, x)
+    assert from_sorted((x, x) for x in keys) == TREE
+    assert all(_lookup(TREE, x) == x for x in keys)
+
+    # ordered prefix/range scans
+    assert [x for x, _ in _iter_range(TREE)] == keys
+    assert list(_iter_prefix(TREE, 'a')) == [(x, x) for x in keys if x.startswith('a')]
+    assert list(_iter_prefix(TREE, keys[0])) == [(keys[0], keys[0])]
+    start, end = keys[50], keys[150]
+    assert [x for x, _ in _iter_range(TREE, start, end)] == keys[50:150]
+    assert [x for x, _ in _iter_range(TREE, '8', '8')] == []
+
+    # deep keys dont hit the recursion limit
+    DEBUG = None
+    TREE = Node.default()
+    for i in range(1, 2000): 
+        _insert(TREE, 'a' * i, i)
+    assert _lookup(TREE, 'a' * 1999) == 1999
+    assert sum(1 for _ in _iter_prefix(TREE, 'aaa')) == 1997
@@ -0,0 +1,192 @@
+# state snapshots: moves a committed state root between dbs without copying the db
+# export streams the accounts under a root (in address order) into chunks of
+# `chunk_size` accounts, each one zlib-compressed + self-verifying:
+#   chunk: varint n_addresses + n * length-prefixed address
+#          + varint n_records + n * (raw digest + length-prefixed record)
+# the records are the chunk's proof (see patricia_merkle.prove): every node on
+# the paths to its accounts + the accounts, so a chunk is checked against the
+# root on its own (+ a bad chunk can be re-fetched from another peer). the
+# import checks every chunk in parallel, rebuilds the tree (bulk-load) and
+# checks the rebuilt root, ie, that no accounts are missing
+#   file: raw state root + n * length-prefixed chunk
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import zlib
+
+from codec import write_varint, read_varint, write_bytes, read_bytes, write_str, read_str
+from patricia_merkle import MerkleNode, iter_range, prove, verify_proofs, DIGEST_SIZE
+from radix16 import from_sorted
+
+def encode_chunk(addresses, proof) -> bytes:
+    out = bytearray()
+    write_varint(out, len(addresses))
+    for address in addresses:
+        write_str(out, address)
+    write_varint(out, len(proof))
+    for digest, record in proof.items():
+        out += digest
+        write_bytes(out, record)
+    return zlib.compress(bytes(out))
+
+def decode_chunk(chunk):
+    buf = memoryview(zlib.decompress(chunk))
+    n, offset = read_varint(buf, 0)
+    addresses = []
+    for _ in range(n):
+        address, offset = read_str(buf, offset)
+        addresses.append(address)
+    n, offset = read_varint(buf, offset)
+    proof = {}
+    for _ in range(n):
+        digest = bytes(buf[offset:offset + DIGEST_SIZE])
+        record, offset = read_bytes(buf, offset + DIGEST_SIZE)
+        proof[digest] = bytes(record)
+    return addresses, proof
+
+# lazily yields the chunks of a committed state (one chunk in memory at a time)
+def export_snapshot(state_root, db, chunk_size=1024):
+    addresses = []
+    for address, _ in iter_range(state_root, db):
+        addresses.append(address)
+        if len(addresses) == chunk_size:
+            yield encode_chunk(addresses, prove(addresses, state_root, db))
+            addresses = []
+    if addresses:
+        yield encode_chunk(addresses, prove(addresses, state_root, db))
+
+# (runs in a worker) the chunk's [(address, account)] in address order, raises ValueError on a bad chunk
+def verify_chunk(state_root, chunk):
+    addresses, proof = decode_chunk(chunk)
+    accounts = verify_proofs(proof, state_root, addresses)
+    if any(account is None for account in accounts.values()):
+        raise ValueError('invalid chunk: missing account')
+    if addresses != sorted(set(addresses)):
+        raise ValueError('invalid chunk: unsorted addresses')
+    return [(address, accounts[address]) for address in addresses]
+
+# verifies the chunks in a process pool as they're read, yields their [(address, account)] in chunk order
+# at most `window` chunks (default: 2 per worker) are read + not yet yielded,
+# so a snapshot is never held in memory (+ a stream of chunks isnt read ahead)
+def verify_chunks(state_root, chunks, workers=None, window=None):
+    window = window or 2 * (workers or os.cpu_count())
+    ctx = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append(pool.submit(verify_chunk, state_root, chunk))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending: # (a bad chunk stops the import)
+                future.cancel()
+
+# verifies + writes the accounts of the chunks to db (each chunk as soon as
+# its verified) and returns the rebuilt tree (committed to db), raises
+# ValueError if a chunk or the root is invalid
+def import_snapshot(state_root, chunks, db, workers=None) -> MerkleNode:
+    items = []
+    for accounts in verify_chunks(state_root, chunks, workers):
+        if items and accounts and accounts[0][0] <= items[-1][0]:
+            raise ValueError('invalid snapshot: overlapping chunks')
+        for address, account in accounts:
+            digest = account.digest()
+            db[digest] = account.serialize()
+            items.append((address, digest))
+
+    tree = from_sorted(items, default=MerkleNode.default)
+    if tree.commit_parallel(db, workers) != state_root:
+        raise ValueError('invalid snapshot: root mismatch (missing chunks)')
+    return tree
+
+def write_snapshot(path, state_root, chunks):
+    with open(path, 'wb') as f:
+        f.write(state_root)
+        for chunk in chunks:
+            out = bytearray()
+            write_bytes(out, chunk)
+            f.write(out)
+
+# returns the state root + a lazy iterator of the chunks
+def read_snapshot(path):
+    f = open(path, 'rb')
+    state_root = f.read(DIGEST_SIZE)
+
+    def chunks():
+        with f:
+            while True:
+                # varint length (one byte at a time) + chunk
+                n = shift = 0
+                while True:
+                    b = f.read(1)
+                    if not b:
+                        return
+                    n |= (b[0] & 0x7f) << shift
+                    if b[0] < 0x80:
+                        break
+                    shift += 7
+                yield f.read(n)
+
+    return state_root, chunks()
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    from account import Account
+    from patricia_merkle import get_account
+    from radix16 import _insert
+
+    rng = random.Random(0)
+    db = {}
+    tree = MerkleNode.default()
+    for _ in range(2000):
+        account = Account(rng.randrange(1000), '%040x' % rng.getrandbits(160))
+        digest = account.digest()
+        db[digest] = account.serialize()
+        _insert(tree, account.address, digest)
+    state_root = tree.commit(db)
+
+    path = os.path.join(tempfile.mkdtemp(), 'state.snapshot')
+    write_snapshot(path, state_root, export_snapshot(state_root, db, chunk_size=256))
+    print('snapshot size:', os.path.getsize(path))
+
+    root, chunks = read_snapshot(path)
+    new_db = {}
+    assert import_snapshot(root, chunks, new_db, workers=2).digest == state_root
+    assert [a for a, _ in iter_range(state_root, new_db)] == [a for a, _ in iter_range(state_root, db)]
+
+    # the chunks are read as the import goes (at most `window` ahead of the verified ones)
+    chunks = list(export_snapshot(state_root, db, chunk_size=64))
+    n_read = 0
+    def reading():
+        global n_read
+        for chunk in chunks:
+            n_read += 1
+            yield chunk
+    for i, accounts in enumerate(verify_chunks(state_root, reading(), workers=2, window=3)):
+        assert n_read <= i + 3
+    assert i + 1 == n_read == len(chunks)
+
+    # a tampered chunk is rejected
+    chunks = list(export_snapshot(state_root, db, chunk_size=256))
+    addresses, proof = decode_chunk(chunks[3])
+    digest = get_account(addresses[0], state_root, db).digest()
+    proof[digest] = Account(10**6, addresses[0]).serialize()
+    chunks[3] = encode_chunk(addresses, proof)
+    try:
+        import_snapshot(state_root, chunks, {}, workers=2)
+        assert False
+    except ValueError:
+        pass
+
+    # a missing chunk is caught by the root check
+    try:
+        import_snapshot(state_root, chunks[:3] + chunks[4:], {}, workers=2)
+        assert False
+    except ValueError:
+        pass
+    print('success')
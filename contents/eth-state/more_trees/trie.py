@@ -1,5 +1,7 @@
 from dataclasses import dataclass
 
+from walk import walk
+
 @dataclass
 class Node: 
     key: str
@@ -8,68 +10,76 @@ class Node:
 
 TREE = Node(None, None, [])
 
+# set to a callable (eg, `print`) to trace what _insert/_lookup are doing
+DEBUG = None
+
 def insert(key: str, value: any):
     _insert(TREE, key, value)
     print('---')
 
+# iterative so keys of any length dont hit the recursion limit
 def _insert(node: Node, key: str, value: any):
-    char = key[0]
-    rest = key[1:]
-
-    # handles initial inserts '1'
-    if node.key == None: 
-        node.key = char 
-    
-    # handles updates (insert '2')
-    if len(rest) == 0: 
-        if node.key != char: 
-            print(f"{node.key} {char}")
-            raise NotImplementedError 
-        else: 
-            print(f'updating node value (k {node.key}): {node.value} -> {value}')
-            node.value = value
-        return # end
-
-    # handles adding a child
-    assert node.key == char
-    
-    child_char = rest[0]
-
-    # if char exists as a child
-    child_dne = True
-    for child_node in node.children: 
-        if child_node.key == child_char: 
-            child_dne = False
-            break 
-        
-    if child_dne: 
-        child_node = Node(child_char, None, [])
-        node.children.append(child_node)
-
-    print(f'traversing node: {node.key}')
-    _insert(child_node, rest, value)
-
-
-insert('1', 1)
-assert(TREE.key == '1')
-assert(TREE.value == 1)
-
-insert('1', 2)
-assert(TREE.key == '1')
-assert(TREE.value == 2)
-
-insert('12', 12)
-assert TREE.key == '1'
-assert TREE.children[0].key == '2'
-assert TREE.children[0].value == 12
-
-insert('123', 123)
-assert(TREE.children[0].children[0].key == '3')
-assert(TREE.children[0].children[0].value == 123)
-
-insert('1a', 124)
-assert(TREE.children[1].key == 'a')
-assert(TREE.children[1].value == 124)
+    i = 0 # index of the char the current node is for
+    while True:
+        char = key[i]
+
+        # handles initial inserts '1'
+        if node.key == None:
+            node.key = char
+
+        # handles updates (insert '2')
+        if i + 1 == len(key):
+            if node.key != char:
+                if DEBUG: DEBUG(f"{node.key} {char}")
+                raise NotImplementedError
+            else:
+                if DEBUG: DEBUG(f'updating node value (k {node.key}): {node.value} -> {value}')
+                node.value = value
+            return # end
+
+        # handles adding a child
+        assert node.key == char
+
+        child_char = key[i + 1]
+
+        # if char exists as a child
+        child_dne = True
+        for child_node in node.children:
+            if child_node.key == child_char:
+                child_dne = False
+                break
+
+        if child_dne:
+            child_node = Node(child_char, None, [])
+            node.children.append(child_node)
+
+        if DEBUG: DEBUG(f'traversing node: {node.key}')
+        node = child_node
+        i += 1
+
+if __name__ == "__main__":
+    DEBUG = print
+
+    insert('1', 1)
+    assert(TREE.key == '1')
+    assert(TREE.value == 1)
+
+    insert('1', 2)
+    assert(TREE.key == '1')
+    assert(TREE.value == 2)
+
+    insert('12', 12)
+    assert TREE.key == '1'
+    assert TREE.children[0].key == '2'
+    assert TREE.children[0].value == 12
+
+    insert('123', 123)
+    assert(TREE.children[0].children[0].key == '3')
+    assert(TREE.children[0].children[0].value == 123)
+
+    insert('1a', 124)
+    assert(TREE.children[1].key == 'a')
+    assert(TREE.children[1].value == 124)
 
 ## ---
 
@@ -78,30 +88,54 @@ def lookup(key: str) -> any:
     return _lookup(TREE, key)
 
 def _lookup(node: Node, key: str) -> any:
-    char = key[0]
-    rest = key[1:]
-
-    # assert were on the right path
-    assert char == node.key
-    if len(rest) == 0: 
-        return node.value
-
-    child_char = rest[0]
-    
-    child_dne = True
-    for child_node in node.children: 
-        if child_node.key == child_char: 
-            child_dne = False
-            break 
-
-    if child_dne: 
-        return None
-    
-    return _lookup(child_node, rest)
-
-assert lookup("1a") == 124
-assert lookup("123") == 123
-assert lookup("12") == 12
-assert lookup("1") == 2
-
-print('success')
\ No newline at end of file
+    i = 0
+    while True:
+        char = key[i]
+
+        # assert were on the right path
+        assert char == node.key
+        if i + 1 == len(key):
+            return node.value
+
+        child_char = key[i + 1]
+
+        child_dne = True
+        for child_node in node.children:
+            if child_node.key == child_char:
+                child_dne = False
+                break
+
+        if child_dne:
+            return None
+
+        node = child_node
+        i += 1
+
+# children are kept in insert order
+def _children(node: Node): 
+    return sorted(node.children, key=lambda child: child.key)
+
+def _iter_prefix(node: Node, prefix: str): 
+    return walk(node, _children, prefix=prefix)
+
+def _iter_range(node: Node, start: str = None, end: str = None): 
+    return walk(node, _children, start, end)
+
+if __name__ == "__main__":
+    assert lookup("1a") == 124
+    assert lookup("123") == 123
+    assert lookup("12") == 12
+    assert lookup("1") == 2
+
+    # ordered prefix/range scans
+    assert list(_iter_range(TREE)) == [('1', 2), ('12', 12), ('123', 123), ('1a', 124)]
+    assert list(_iter_prefix(TREE, '12')) == [('12', 12), ('123', 123)]
+    assert list(_iter_range(TREE, '120', '1b')) == [('123', 123), ('1a', 124)]
+
+    # deep keys dont hit the recursion limit
+    DEBUG = None
+    insert('1' * 5000, 5000)
+    assert lookup('1' * 5000) == 5000
+    assert list(_iter_prefix(TREE, '1' * 4999)) == [('1' * 5000, 5000)]
+
+    print('success')
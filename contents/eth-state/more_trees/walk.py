@@ -0,0 +1,30 @@
+# ordered scans shared by the trees (trie, radix, radix16 + committed patricia roots)
+# lazily yields the (key, value)s under node in key order, with the key in 
+# [start, end) + starting with prefix. only one child iterator per level is 
+# kept (explicit stack) so subtrees of any size stream in O(depth) memory and 
+# subtrees outside the bounds are skipped without being visited. 
+# children(node) => the node's children in key order (eg, loaded from a db)
+
+def walk(node, children, start=None, end=None, prefix=''):
+    stack = [('', iter((node,)))] # (path of the parent, its children)
+    while stack: 
+        parent_path, kids = stack[-1]
+        child = next(kids, None)
+        if child is None: 
+            stack.pop()
+            continue
+
+        path = parent_path + (child.key or '')
+        if end is not None and path >= end: 
+            return # every later key is >= path
+        if not path.startswith(prefix): 
+            if path > prefix: 
+                return # past the prefix
+            if not prefix.startswith(path): 
+                continue # subtree cant contain the prefix
+        if start is not None and path < start and not start.startswith(path): 
+            continue # whole subtree is < start
+
+        if child.value is not None and path.startswith(prefix) and (start is None or path >= start): 
+            yield path, child.value
+        stack.append((path, iter(children(child))))
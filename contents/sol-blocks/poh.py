@@ -0,0 +1,179 @@
+# proof-of-history: the entry loop from index.md (see "proof-of-history and the `Entry` struct")
+#   - a tick entry = num_hashes chained hashes of the last hash (h = hash(h))
+#   - a tx entry = num_hashes - 1 chained hashes + the txs' merkle root mixed
+#     in: hash([h, tx_root(txs)])
+#   - each entry starts from the previous entry's hash (the first from the parent blockhash)
+# since every entry's start hash is known, a recorded chain is verified in
+# segments (in parallel across cores) instead of one hash at a time
+# usage: python poh.py [hashes_per_tick] [ticks_per_slot]
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import multiprocessing
+import os
+import sys
+import time
+
+# hash + MerkleTree come from the eth-state engines (hashing via utils' path)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "eth-state", "eth-state-py"))
+from utils import Transaction, hash, tx_root
+import hashing
+
+
+@dataclass
+class Entry:
+    num_hashes: int  # hashes since the previous entry (including the mixin)
+    hash: bytes  # hash after num_hashes
+    transactions: list[Transaction] = field(default_factory=list)  # [] = a tick
+
+
+# h after n chained hashes
+# (the hash function is looked up once: the loop is only the hash calls)
+def hash_n(h, n):
+    step = hashing.hasher()
+    for _ in range(n):
+        h = step(h)
+    return h
+
+
+class PohRecorder:
+    def __init__(self, start_hash, hashes_per_tick=12500, ticks_per_slot=64) -> None:
+        self.hash = start_hash
+        self.hashes_per_tick = hashes_per_tick
+        self.ticks_per_slot = ticks_per_slot
+        self.num_hashes = 0  # since the last entry
+        self.tick_hashes = 0  # since the last tick
+        self.ticks = 0
+        self.entries = []
+
+    # the slot is over after ticks_per_slot ticks
+    def done(self) -> bool:
+        return self.ticks >= self.ticks_per_slot
+
+    # hashes up to (not including) the next mixin/tick
+    def hash_until(self, n):
+        n = min(n, self.hashes_per_tick - self.tick_hashes - 1)
+        if n > 0:
+            self.hash = hash_n(self.hash, n)
+            self.num_hashes += n
+            self.tick_hashes += n
+
+    # mixes a batch of txs into the chain (one hash)
+    # (None if the slot ended on the implicit tick: the txs go in the next slot)
+    def record(self, txs: list[Transaction]) -> Entry | None:
+        assert len(txs) > 0 and not self.done()
+        if self.tick_hashes == self.hashes_per_tick - 1:
+            self.tick()  # the tick's last hash isnt a mixin
+            if self.done():
+                return None
+        self.hash = hash([self.hash, tx_root(txs)])
+        self.num_hashes += 1
+        self.tick_hashes += 1
+        return self._entry(txs)
+
+    # hashes to the end of the current tick
+    def tick(self) -> Entry:
+        assert not self.done()
+        n = self.hashes_per_tick - self.tick_hashes
+        self.hash = hash_n(self.hash, n)
+        self.num_hashes += n
+        self.tick_hashes = 0
+        self.ticks += 1
+        return self._entry([])
+
+    def _entry(self, txs):
+        entry = Entry(self.num_hashes, self.hash, txs)
+        self.entries.append(entry)
+        self.num_hashes = 0
+        return entry
+
+
+# index of the first invalid entry (None = the chain is valid)
+def verify_entries(start_hash, entries, offset=0):
+    h = start_hash
+    for i, entry in enumerate(entries):
+        if entry.num_hashes < 1:
+            return offset + i
+        if entry.transactions:
+            h = hash([hash_n(h, entry.num_hashes - 1), tx_root(entry.transactions)])
+        else:
+            h = hash_n(h, entry.num_hashes)
+        if h != entry.hash:
+            return offset + i
+    return None
+
+
+# splits the entries into segments of ~equal hash counts (each starts at the
+# previous entry's hash) + verifies them in parallel
+def verify_parallel(start_hash, entries, workers=None):
+    workers = workers or os.cpu_count()
+    total = sum(entry.num_hashes for entry in entries)
+    bounds, count = [0], 0
+    for i, entry in enumerate(entries):
+        count += entry.num_hashes
+        if count >= total * len(bounds) / workers and i + 1 < len(entries):
+            bounds.append(i + 1)
+    bounds.append(len(entries))
+
+    starts = [start_hash if lo == 0 else entries[lo - 1].hash for lo in bounds[:-1]]
+    segments = [entries[lo:hi] for lo, hi in zip(bounds, bounds[1:])]
+    ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        for invalid in pool.map(verify_entries, starts, segments, bounds[:-1]):
+            if invalid is not None:
+                return invalid
+    return None
+
+
+if __name__ == "__main__":
+    import random
+
+    hashes_per_tick = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    ticks_per_slot = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    # hashes/s on one core
+    n = 1_000_000
+    start = time.perf_counter()
+    hash_n(bytes(32), n)
+    rate = n / (time.perf_counter() - start)
+    print(f"hash_n: {rate:,.0f} hashes/s/core")
+    # (solana targets 64 ticks * 12500 hashes per 400ms slot)
+    print(f"  a 64 * 12500 hash slot takes {64 * 12500 / rate * 1000:,.0f}ms (target 400ms)")
+
+    # one slot of entries: txs are mixed in between the ticks
+    rng = random.Random(0)
+    parent_hash = hash(b"parent blockhash")
+    poh = PohRecorder(parent_hash, hashes_per_tick, ticks_per_slot)
+    start = time.perf_counter()
+    while not poh.done():
+        poh.hash_until(rng.randrange(hashes_per_tick // 2))
+        if rng.random() < 0.5:
+            poh.record([Transaction(f"{rng.randrange(100):x}", rng.randrange(1000)) for _ in range(8)])
+        else:
+            poh.tick()
+    elapsed = time.perf_counter() - start
+    entries = poh.entries
+    n_hashes = sum(entry.num_hashes for entry in entries)
+    assert n_hashes == hashes_per_tick * ticks_per_slot
+    assert sum(1 for entry in entries if not entry.transactions) == ticks_per_slot
+    print(f"slot: {len(entries)} entries, {n_hashes:,} hashes in {elapsed:.3f}s")
+
+    start = time.perf_counter()
+    assert verify_entries(parent_hash, entries) is None
+    serial = time.perf_counter() - start
+    start = time.perf_counter()
+    assert verify_parallel(parent_hash, entries) is None
+    parallel = time.perf_counter() - start
+    print(f"verify: {serial:.3f}s serial, {parallel:.3f}s on {os.cpu_count()} cores ({serial / parallel:.1f}x)")
+
+    # a record which lands on the slot's last hash only ticks (no hashes past the slot)
+    poh = PohRecorder(parent_hash, hashes_per_tick=4, ticks_per_slot=1)
+    poh.hash_until(10)
+    assert poh.record([Transaction("a", 1)]) is None and poh.done()
+    assert [entry.num_hashes for entry in poh.entries] == [4]
+    assert verify_entries(parent_hash, poh.entries) is None
+
+    # a tampered entry/skipped hash is caught (at its index)
+    i = len(entries) // 2
+    entries[i] = Entry(entries[i].num_hashes - 1, entries[i].hash, entries[i].transactions)
+    assert verify_parallel(parent_hash, entries, workers=4) == i
+    assert verify_entries(parent_hash, entries) == i